@@ -0,0 +1,225 @@
+"""
+Агрегация данных DNM на уровне дилер × модель
+
+Данные за (год, возрастная группа) загружаются один раз с разбивкой
+по дилерам, а любой выбор Holding / Region / Mobis Code считается
+в памяти векторной суммой по строкам выбранных дилеров.
+"""
+from database.dealers import dealer_directory
+from database.schema import apply_dnm_schema
+from .metrics import can_compute, compute_metric
+
+
+# Колонки, которые корректно суммируются по дилерам
+ADDITIVE_COLUMNS = (
+    [f'age_{year}' for year in range(0, 11)] +
+    [
+        'age_0_3', 'age_4_5', 'age_6_10',
+        'total_0_10', 'total_0_5',
+        'uio', 'uio_10y', 'uio_5y',
+        'avg_uio_10y', 'avg_uio_5y',
+        'total_ro_cost',
+        'labor_hours_0_10', 'labor_hours_0_5',
+        'labor_amount_0_10', 'labor_amount_0_5',
+        'parts_amount_0_10', 'parts_amount_0_5',
+    ]
+)
+
+# Возрастные диапазоны: колонка диапазона — сумма колонок age_<год>
+AGE_BANDS = {
+    'age_0_3': [f'age_{year}' for year in range(0, 4)],
+    'age_4_5': [f'age_{year}' for year in range(4, 6)],
+    'age_6_10': [f'age_{year}' for year in range(6, 11)],
+}
+
+# Средние и доли, которые пересчитываются после суммирования
+DERIVED_COLUMNS = [
+    'avg_ro_cost', 'aver_labor_hours_per_vhc',
+    'avg_ro_labor_cost', 'avg_ro_part_cost',
+    'pct_age_0_3', 'pct_age_4_5', 'pct_age_6_10',
+    'ro_ratio_of_uio_10y', 'ro_ratio_of_uio_5y',
+]
+
+
+def recompute_derived(df, age_group='0-10Y'):
+    """
+    Пересчитывает средние и доли из просуммированных колонок
+
+    Средние и доли не суммируются по дилерам, поэтому после агрегации
+    они считаются заново по определениям DERIVED_METRICS: средний чек,
+    нормо-часы и стоимость работ и запчастей на RO, доли возрастных
+    групп и RO / UIO.
+
+    Args:
+        df: Агрегированный DataFrame
+        age_group: Возрастная группа ('0-10Y' или '0-5Y')
+
+    Returns:
+        pd.DataFrame: Тот же DataFrame с пересчитанными колонками
+    """
+    total_col = 'total_0_5' if age_group == '0-5Y' else 'total_0_10'
+    if total_col not in df.columns:
+        return df
+
+    for col in DERIVED_COLUMNS:
+        if col in df.columns and can_compute(col, df.columns, age_group):
+            df[col] = compute_metric(col, df, age_group)
+    return df
+
+
+def select_mobis_codes(selected_mobis_code='All', selected_holding='All',
+                       selected_region='All'):
+    """
+    Возвращает коды дилеров, попадающих под все выбранные фильтры
+
+    Returns:
+        list | None: Список mobis_code или None, если фильтров нет
+    """
+    if (selected_mobis_code == 'All' and selected_holding == 'All'
+            and selected_region == 'All'):
+        return None
+
+    codes = set(dealer_directory.mobis_codes_by_holding(selected_holding))
+    codes &= set(dealer_directory.mobis_codes_by_region(selected_region))
+    if selected_mobis_code != 'All':
+        codes &= {selected_mobis_code}
+    return sorted(codes)
+
+
+def aggregate_dealers(frame, mobis_codes=None, age_group='0-10Y'):
+    """
+    Суммирует строки дилер × модель по выбранным дилерам
+
+    Args:
+        frame: DataFrame с колонкой mobis_code (одна строка на
+               дилера и модель)
+        mobis_codes: Коды дилеров для суммирования (None — все)
+        age_group: Возрастная группа для пересчета средних
+
+    Returns:
+        pd.DataFrame: Одна строка на модель с суммируемыми и
+                      пересчитанными колонками — как у обычного
+                      DNM-запроса
+    """
+    if mobis_codes is not None:
+        frame = frame[frame['mobis_code'].isin(mobis_codes)]
+
+    sum_cols = [col for col in ADDITIVE_COLUMNS if col in frame.columns]
+    # float32-колонки суммируются в float64; типы схемы — в конце
+    upcast = {
+        col: 'float64' for col in sum_cols if frame[col].dtype == 'float32'
+    }
+    if upcast:
+        frame = frame.astype(upcast)
+    df = (
+        frame.groupby('model', observed=True, sort=False)[sum_cols]
+        .sum()
+        .reset_index()
+    )
+
+    # Средние и доли пересчитываются ниже; порядок колонок — исходный
+    for col in DERIVED_COLUMNS:
+        if col in frame.columns:
+            df[col] = 0.0
+    df = df[[col for col in frame.columns if col in df.columns]]
+
+    df = recompute_derived(df, age_group)
+    return apply_dnm_schema(df)
+
+
+# Колонки 0-5Y и шаблоны их источников в результате 0-10Y: колонка
+# 0-5Y равна сумме источника по возрастам 0..5
+AGE_0_5_SOURCES = {
+    'total_0_5': 'age_{}',
+    'total_ro_cost': 'ro_cost_age_{}',
+    'labor_hours_0_5': 'labor_hours_age_{}',
+    'labor_amount_0_5': 'labor_amount_age_{}',
+    'parts_amount_0_5': 'parts_amount_age_{}',
+    'uio_5y': 'uio_age_{}',
+    'avg_uio_5y': 'avg_uio_age_{}',
+}
+
+# Колонки 0-10Y, которые уже относятся только к возрастам 0..5
+_AGE_0_5_PASSTHROUGH = (
+    ['mobis_code', 'model'] +
+    [f'age_{year}' for year in range(0, 6)] +
+    ['age_0_3', 'age_4_5']
+)
+
+_AGE_0_5_DERIVED = [
+    'avg_ro_cost', 'aver_labor_hours_per_vhc',
+    'avg_ro_labor_cost', 'avg_ro_part_cost',
+    'pct_age_0_3', 'pct_age_4_5',
+]
+
+
+def age_0_5_sources(columns):
+    """
+    Колонки результата 0-10Y, из которых выводится каждая колонка 0-5Y
+
+    Проверяются только имена колонок, поэтому проверку можно сделать
+    до загрузки данных. Колонка 0-5Y берется суммой по возрастам 0..5
+    из колонок вида <показатель>_age_<год> (см. AGE_0_5_SOURCES) либо
+    напрямую, если результат 0-10Y уже содержит ее (кроме
+    total_ro_cost, который в 0-10Y относится ко всем возрастам).
+
+    Args:
+        columns: Колонки результата 0-10Y
+
+    Returns:
+        dict | None: {колонка 0-5Y: список колонок-источников} или None,
+                     если хотя бы одну колонку 0-5Y не вывести
+    """
+    columns = set(columns)
+    sources = {}
+    for target, pattern in AGE_0_5_SOURCES.items():
+        ages = [pattern.format(year) for year in range(0, 6)]
+        if all(col in columns for col in ages):
+            sources[target] = ages
+        elif target in columns and target != 'total_ro_cost':
+            sources[target] = [target]
+        else:
+            return None
+    return sources
+
+
+def derive_age_0_5(frame):
+    """
+    Строит данные 0-5Y из результата 0-10Y без отдельного запроса
+
+    Источники колонок — см. age_0_5_sources; возрастные колонки
+    age_0..age_5 и диапазоны age_0_3, age_4_5 переносятся как есть.
+    Средние и доли пересчитываются.
+
+    Args:
+        frame: DataFrame с результатом 0-10Y (допускается mobis_code)
+
+    Returns:
+        pd.DataFrame | None: Данные 0-5Y или None, если в результате
+                             0-10Y недостаточно колонок
+    """
+    sources = age_0_5_sources(frame.columns)
+    if sources is None:
+        return None
+
+    derived = {
+        target: (frame[cols[0]].to_numpy() if len(cols) == 1
+                 else frame[cols].to_numpy().sum(axis=1))
+        for target, cols in sources.items()
+    }
+
+    df = frame[[
+        col for col in _AGE_0_5_PASSTHROUGH if col in frame.columns
+    ]].copy()
+    for col, values in derived.items():
+        df[col] = values
+    if 'uio' in frame.columns:
+        df['uio'] = derived['uio_5y']
+
+    for col in _AGE_0_5_DERIVED:
+        if col in frame.columns:
+            df[col] = 0.0
+    df['ro_ratio_of_uio_5y'] = 0.0
+
+    df = recompute_derived(df, '0-5Y')
+    return apply_dnm_schema(df)
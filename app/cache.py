@@ -0,0 +1,575 @@
+"""
+Кеширование данных дашборда
+
+ResultCache — кеш результатов в памяти с бюджетом в байтах (LRU),
+TTL записей, счетчиками попаданий / промахов / вытеснений и явной
+инвалидацией. В режиме stale-while-revalidate истекшая запись сразу
+отдается вызывающему коду, а обновляется в фоновом потоке, поэтому
+задержка интерактивных запросов не зависит от TTL. Загрузки,
+вложенные в фоновое обновление (например, данные под представлением
+дашборда), истекшие записи не получают и ждут свежие данные, иначе
+обновленная запись строилась бы из устаревших. Одновременные
+промахи по одному ключу объединяются
+через SingleFlight: пока запрос по ключу выполняется, остальные
+вызовы с тем же ключом ждут его результат вместо того, чтобы идти
+в БД самостоятельно.
+
+DataFrame отдаются только для чтения: при сохранении массивы колонок
+помечаются как недоступные для записи, а наружу отдается поверхностная
+копия. Замена или добавление колонки в копии кеш не затрагивает, а
+запись на месте (loc / iloc / inplace) падает с ValueError вместо
+того, чтобы молча испортить закешированные данные.
+
+ParquetStore — необязательный второй уровень кеша на диске. Каталог
+общий для всех процессов-воркеров на хосте: запись, загруженная одним
+воркером, сразу доступна остальным и переживает перезапуск. Загрузка
+одного ключа разными процессами сериализуется файловой блокировкой.
+"""
+import ast
+import contextvars
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+# Признак фонового обновления записи (stale-while-revalidate):
+# вложенные get_or_load в том же контексте не отдают истекшие записи
+_revalidating = contextvars.ContextVar('dnm_cache_revalidating',
+                                       default=False)
+
+
+class _Call:
+    """Выполняющийся вызов SingleFlight"""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Потокобезопасная дедупликация одновременных вызовов по ключу"""
+
+    def __init__(self, name: str = 'single-flight'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared_calls = 0
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Выполняет fn(*args, **kwargs) один раз для всех одновременных
+        вызовов с одинаковым key
+
+        Первый вызов выполняет функцию, остальные ждут и получают тот же
+        результат (или то же исключение). После завершения ключ
+        освобождается — следующий вызов снова выполнит функцию.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+            else:
+                self.shared_calls += 1
+
+        if not leader:
+            logger.debug(f'{self.name}: ждем выполняющийся запрос {key}')
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    def in_flight(self) -> int:
+        """Количество выполняющихся сейчас ключей"""
+        with self._lock:
+            return len(self._calls)
+
+
+class _Entry:
+    """Запись ResultCache"""
+
+    __slots__ = ('value', 'nbytes', 'expires_at')
+
+    def __init__(self, value, nbytes, expires_at):
+        self.value = value
+        self.nbytes = nbytes
+        self.expires_at = expires_at
+
+
+def _sizeof(value) -> int:
+    """Размер значения в байтах (для DataFrame — с учетом строк,
+    для массивов и кубов — по nbytes)"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+def _freeze(value):
+    """
+    Помечает массивы DataFrame / Series как недоступные для записи
+
+    Обходит и вложенные кортежи и словари (DashboardView, срезы
+    графиков); списки записей не обходятся. Расширенные типы
+    (Categorical и т. п.) и object-колонки остаются как есть: часть
+    функций pandas (memory_usage(deep=True)) не принимает object-массив
+    только для чтения.
+    """
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        # Массивы блоков, а не колонки: представление колонки блока
+        # не защищает сам блок от записи
+        for array in value._mgr.arrays:
+            if isinstance(array, np.ndarray) and array.dtype != object:
+                array.flags.writeable = False
+    elif isinstance(value, tuple):
+        for item in value:
+            _freeze(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _freeze(item)
+
+
+def _readonly(value):
+    """Отдает DataFrame из кеша как поверхностную копию (массивы
+    колонок общие с кешем и недоступны для записи)"""
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy(deep=False)
+    return value
+
+
+class ParquetStore:
+    """
+    Общий для процессов кеш DataFrame в Parquet-файлах каталога
+
+    Файл записи называется по хешу ключа; сам ключ и срок жизни
+    хранятся в метаданных файла. Запись атомарная (временный файл +
+    os.replace), поэтому читатели никогда не видят файл частично.
+    """
+
+    KEY_METADATA = b'dnm_cache_key'
+    EXPIRES_METADATA = b'dnm_cache_expires_at'
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.purge()
+
+    def _path(self, key, suffix='.parquet') -> str:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{digest}{suffix}')
+
+    @contextmanager
+    def lock(self, key):
+        """Межпроцессная блокировка загрузки ключа (flock, если доступен)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self._path(key, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """
+        Читает запись по ключу
+
+        Returns:
+            tuple | None: (DataFrame, expires_at) или None, если записи
+                          нет или она истекла; expires_at — время
+                          time.time() окончания жизни или None
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            parquet_file = pq.ParquetFile(path)
+            metadata = parquet_file.schema_arrow.metadata or {}
+            expires_at = metadata.get(self.EXPIRES_METADATA, b'')
+            expires_at = float(expires_at) if expires_at else None
+            if expires_at is not None and expires_at <= time.time():
+                self._unlink(path)
+                return None
+            return parquet_file.read().to_pandas(), expires_at
+        except Exception as e:
+            logger.warning(f'Не удалось прочитать {path}: {e}')
+            return None
+
+    def set(self, key, df: pd.DataFrame, ttl: float = None):
+        """Сохраняет DataFrame атомарно; ttl None или 0 — без срока"""
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        expires_at = repr(time.time() + ttl) if ttl else ''
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({
+                **(table.schema.metadata or {}),
+                self.KEY_METADATA: repr(key).encode('utf-8'),
+                self.EXPIRES_METADATA: expires_at.encode('utf-8'),
+            })
+            pq.write_table(table, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f'Не удалось сохранить {key} на диск: {e}')
+            self._unlink(tmp_path)
+
+    def keys(self):
+        """Ключи сохраненных записей"""
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.parquet'):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                metadata = pq.read_schema(path).metadata or {}
+                yield ast.literal_eval(
+                    metadata[self.KEY_METADATA].decode('utf-8')
+                )
+            except Exception:
+                continue
+
+    def delete(self, key):
+        """Удаляет запись по ключу"""
+        self._unlink(self._path(key))
+
+    def purge(self) -> int:
+        """
+        Удаляет истекшие записи, брошенные временные файлы и файлы
+        блокировок без записи
+        """
+        removed = 0
+        now = time.time()
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if filename.endswith('.tmp'):
+                # Временный файл старше часа — след упавшего процесса
+                if os.path.getmtime(path) < now - 3600:
+                    removed += self._unlink(path)
+                continue
+            if filename.endswith('.lock'):
+                removed += self._purge_lock(path, now)
+                continue
+            if not filename.endswith('.parquet'):
+                continue
+            try:
+                metadata = pq.read_schema(path).metadata or {}
+                expires_at = metadata.get(self.EXPIRES_METADATA, b'')
+                if expires_at and float(expires_at) <= now:
+                    removed += self._unlink(path)
+            except Exception:
+                continue
+        if removed:
+            logger.info(f'Кеш на диске: удалено {removed} устаревших файлов')
+        return removed
+
+    def _purge_lock(self, path, now) -> int:
+        """
+        Удаляет файл блокировки, если записи для него нет, файл старше
+        часа и блокировку никто не держит
+        """
+        if os.path.exists(path[:-len('.lock')] + '.parquet'):
+            return 0
+        try:
+            if os.path.getmtime(path) >= now - 3600:
+                return 0
+            if fcntl is None:
+                return self._unlink(path)
+            with open(path, 'a') as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return 0
+                try:
+                    return self._unlink(path)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _unlink(path) -> int:
+        try:
+            os.remove(path)
+            return 1
+        except FileNotFoundError:
+            return 0
+
+
+class ResultCache:
+    """Кеш результатов с бюджетом в байтах, TTL и статистикой"""
+
+    def __init__(self, name: str, max_bytes: int, ttl: float = None,
+                 store: ParquetStore = None,
+                 stale_while_revalidate: bool = False,
+                 persist=None):
+        """
+        Args:
+            name: Имя кеша (для логов и статистики)
+            max_bytes: Бюджет памяти в байтах; при превышении
+                       вытесняются давно не использованные записи
+            ttl: Время жизни записи в секундах по умолчанию
+                 (None или 0 — без ограничения)
+            store: Общий кеш на диске (второй уровень)
+            stale_while_revalidate: Отдавать истекшую запись из
+                                    get_or_load и обновлять ее в фоне
+            persist: persist(key) — идет ли ключ через store (файловая
+                     блокировка и запись на диск); None — все ключи.
+                     На диск в любом случае пишутся только DataFrame.
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.store = store
+        self.stale_while_revalidate = stale_while_revalidate
+        self.persist = persist
+        self._refreshing = set()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flight = SingleFlight(name)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.store_hits = 0
+        self.stale_hits = 0
+        self.refresh_errors = 0
+
+    def get(self, key, default=None):
+        """Возвращает значение по ключу или default (промах / истек TTL)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return _readonly(entry.value)
+
+    def __contains__(self, key) -> bool:
+        """Есть ли непросроченная запись в памяти (без учета в
+        статистике и без обращения к диску)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Сохраняет значение; ttl переопределяет TTL кеша по умолчанию
+
+        Значение больше всего бюджета не кешируется. Массивы DataFrame
+        в значении становятся недоступными для записи (см. _freeze).
+        """
+        nbytes = _sizeof(value)
+        if nbytes > self.max_bytes:
+            logger.warning(
+                f'{self.name}: значение {key} ({nbytes} байт) больше '
+                f'бюджета кеша ({self.max_bytes} байт), не кешируем'
+            )
+            return
+
+        _freeze(value)
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(value, nbytes, expires_at)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                evicted, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+                self.evictions += 1
+                logger.debug(f'{self.name}: вытеснена запись {evicted}')
+
+    def get_or_load(self, key, loader, ttl: float = None):
+        """
+        Возвращает значение из кеша или загружает его через loader()
+
+        Порядок: память процесса, затем общий кеш на диске, затем
+        loader(). Одновременные промахи по одному ключу выполняют
+        loader один раз — и внутри процесса, и между процессами.
+        В режиме stale-while-revalidate истекшая запись возвращается
+        сразу, а loader выполняется в фоновом потоке. Внутри фонового
+        обновления другой записи истекшая запись не отдается: вызов
+        ждет свежее значение, а сама запись остается доступной
+        остальным вызывающим до конца загрузки.
+        """
+        if self.stale_while_revalidate:
+            with self._lock:
+                entry = self._entries.get(key)
+                stale = entry is not None and self._expired(entry)
+                if stale and not _revalidating.get():
+                    self._entries.move_to_end(key)
+                    self.stale_hits += 1
+                    self._refresh_in_background(key, loader, ttl)
+                    return _readonly(entry.value)
+            if stale:
+                return _readonly(
+                    self._flight.do(key, self._load, key, loader, ttl)
+                )
+
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        return _readonly(self._flight.do(key, self._load, key, loader, ttl))
+
+    def _refresh_in_background(self, key, loader, ttl):
+        # Вызывается под self._lock: один фоновый поток на ключ
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        threading.Thread(
+            target=self._refresh,
+            args=(key, loader, ttl),
+            name=f'{self.name}-refresh',
+            daemon=True,
+        ).start()
+
+    def _refresh(self, key, loader, ttl):
+        _revalidating.set(True)
+        try:
+            logger.debug(f'{self.name}: фоновое обновление {key}')
+            self._flight.do(key, self._load, key, loader, ttl)
+        except Exception as e:
+            # Истекшая запись остается в кеше до следующей попытки
+            with self._lock:
+                self.refresh_errors += 1
+            logger.error(f'{self.name}: ошибка фонового обновления {key}: {e}')
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _load(self, key, loader, ttl):
+        # Пока ждали очередь, значение мог загрузить другой поток
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry):
+                return entry.value
+
+        if self.store is None or (
+                self.persist is not None and not self.persist(key)):
+            value = loader()
+            self.set(key, value, ttl)
+            return value
+
+        ttl = self.ttl if ttl is None else ttl
+        with self.store.lock(key):
+            # Другой процесс мог загрузить значение, пока ждали блокировку
+            stored = self.store.get(key)
+            if stored is not None:
+                value, expires_at = stored
+                with self._lock:
+                    self.store_hits += 1
+                logger.debug(f'{self.name}: {key} прочитан с диска')
+                if expires_at is not None:
+                    ttl = max(expires_at - time.time(), 1e-3)
+            else:
+                value = loader()
+                if isinstance(value, pd.DataFrame):
+                    self.store.set(key, value, ttl)
+        self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, predicate=None) -> int:
+        """
+        Удаляет записи, для ключей которых predicate(key) истинен
+        (без predicate — все записи)
+
+        Returns:
+            int: Количество удаленных записей
+        """
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if predicate is None or predicate(key)
+            ]
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if self.store is not None:
+            for key in list(self.store.keys()):
+                if predicate is None or predicate(key):
+                    self.store.delete(key)
+        if keys:
+            logger.info(f'{self.name}: инвалидировано {len(keys)} записей')
+        return len(keys)
+
+    def clear(self):
+        """Удаляет все записи"""
+        self.invalidate()
+
+    def stats(self) -> dict:
+        """Статистика кеша: размер, попадания, промахи, вытеснения"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'name': self.name,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'store_hits': self.store_hits,
+                'stale_hits': self.stale_hits,
+                'refreshing': len(self._refreshing),
+                'refresh_errors': self.refresh_errors,
+                'store_dir': self.store.directory if self.store else None,
+                'in_flight': self._flight.in_flight(),
+                'shared_loads': self._flight.shared_calls,
+            }
+
+    def _expired(self, entry) -> bool:
+        return (entry.expires_at is not None
+                and entry.expires_at <= time.monotonic())
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry.nbytes
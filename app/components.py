@@ -190,7 +190,8 @@ def create_data_table(columns: list, data: list,
                 if col_id == 'aver_labor_hours_per_vhc':
                     value = f'{value:.1f}'
                 elif col_id in ['ro_ratio_of_uio_10y',
-                                'ro_ratio_of_uio_5y']:
+                                'ro_ratio_of_uio_5y',
+                                'ro_ratio_of_avg_uio_5y']:
                     value = f'{value:.1f}%'
                 elif col_id in ['pct_age_0_3', 'pct_age_4_5',
                                 'pct_age_6_10']:
@@ -0,0 +1,151 @@
+"""
+Куб данных DNM дилер × модель × показатель
+
+Выборка дилер × модель за (год, возрастная группа) один раз
+раскладывается в плотный numpy-массив values[дилер, модель, показатель].
+Любой выбор Holding / Region / Mobis Code — это сумма по маске дилеров,
+после которой средние и доли пересчитываются векторно.
+"""
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from database.schema import DNM_SCHEMA
+from .aggregation import (
+    ADDITIVE_COLUMNS,
+    AGE_BANDS,
+    DERIVED_COLUMNS,
+    recompute_derived
+)
+
+
+class DealerCube:
+    """Плотный куб суммируемых показателей дилер × модель"""
+
+    def __init__(self, frame: pd.DataFrame, age_group: str = '0-10Y'):
+        """
+        Строки без mobis_code или model отбрасываются: factorize дает
+        им индекс -1, и np.add.at прибавил бы их к последнему дилеру
+        или модели.
+
+        Args:
+            frame: Выборка с колонками mobis_code, model и показателями
+                   (одна строка на дилера и модель)
+            age_group: Возрастная группа для пересчета средних
+        """
+        self.age_group = age_group
+        missing_keys = frame['mobis_code'].isna() | frame['model'].isna()
+        if missing_keys.any():
+            logger.warning(
+                f'Куб {age_group}: пропущено {int(missing_keys.sum())} '
+                f'строк без mobis_code или model'
+            )
+            frame = frame[~missing_keys]
+        self.measures = [
+            col for col in ADDITIVE_COLUMNS if col in frame.columns
+        ]
+        self._measure_pos = {
+            col: pos for pos, col in enumerate(self.measures)
+        }
+        self.derived = [
+            col for col in DERIVED_COLUMNS if col in frame.columns
+        ]
+        # Порядок колонок результата — как у исходной выборки
+        self.columns = [
+            col for col in frame.columns
+            if col == 'model' or col in self.measures or col in self.derived
+        ]
+
+        dealer_idx, self.dealers = pd.factorize(
+            frame['mobis_code'], sort=True
+        )
+        model_idx, models = pd.factorize(frame['model'])
+        self.models = np.asarray(models, dtype=object)
+        self._model_dtype = pd.CategoricalDtype(sorted(self.models))
+        self._dealer_pos = {
+            code: pos for pos, code in enumerate(self.dealers)
+        }
+
+        shape = (len(self.dealers), len(self.models))
+        self.values = np.zeros(shape + (len(self.measures),))
+        np.add.at(
+            self.values, (dealer_idx, model_idx),
+            frame[self.measures].to_numpy(dtype='float64')
+        )
+        # Модели, по которым у дилера есть строки
+        self.present = np.zeros(shape, dtype=bool)
+        self.present[dealer_idx, model_idx] = True
+
+        self.values.flags.writeable = False
+        self.present.flags.writeable = False
+
+    @property
+    def nbytes(self) -> int:
+        """Размер массивов куба в байтах"""
+        return int(self.values.nbytes + self.present.nbytes)
+
+    def dealer_mask(self, mobis_codes=None) -> np.ndarray:
+        """Булева маска дилеров куба (None — все дилеры)"""
+        if mobis_codes is None:
+            return np.ones(len(self.dealers), dtype=bool)
+        mask = np.zeros(len(self.dealers), dtype=bool)
+        positions = [
+            self._dealer_pos[code] for code in mobis_codes
+            if code in self._dealer_pos
+        ]
+        mask[positions] = True
+        return mask
+
+    def rollup(self, mobis_codes=None, average=False) -> pd.DataFrame:
+        """
+        Сумма по выбранным дилерам с пересчетом средних и долей
+
+        Args:
+            mobis_codes: Коды дилеров (None — все дилеры)
+            average: Вернуть среднее на дилера вместо суммы (делится
+                     на число дилеров, у которых есть строки модели)
+
+        Returns:
+            pd.DataFrame: Одна строка на модель в формате результата
+                          process_dataframe
+        """
+        mask = self.dealer_mask(mobis_codes)
+        # Сумма по маске без копирования выбранных срезов куба
+        totals = np.tensordot(mask, self.values, axes=(0, 0))
+        dealers = self.present[mask].sum(axis=0)
+        models = dealers > 0
+
+        totals = totals[models]
+        if average:
+            totals = totals / dealers[models][:, None]
+        data = {
+            'model': pd.Categorical(
+                self.models[models], dtype=self._model_dtype
+            )
+        }
+        for pos, col in enumerate(self.measures):
+            data[col] = totals[:, pos]
+        for col in self.derived:
+            data[col] = np.zeros(len(totals))
+
+        # Возрастные диапазоны, если их нет в выборке (как в
+        # process_dataframe)
+        for band, ages in AGE_BANDS.items():
+            positions = [self._measure_pos.get(age) for age in ages]
+            if band not in data and None not in positions:
+                data[band] = totals[:, positions].sum(axis=1)
+
+        columns = self.columns + [
+            col for col in AGE_BANDS if col in data and col not in self.columns
+        ]
+        df = pd.DataFrame(data, columns=columns)
+        # Доли и средние считаются по точным значениям, затем счетчики
+        # округляются и все колонки получают типы схемы
+        df = recompute_derived(df, self.age_group)
+        for col in columns[1:]:
+            dtype = DNM_SCHEMA.get(col, 'float64')
+            values = df[col].to_numpy()
+            if dtype == 'int32':
+                values = np.rint(values)
+            df[col] = values.astype(dtype)
+        return df
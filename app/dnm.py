@@ -6,10 +6,15 @@ from dash import (
     html, dcc, callback, Input, Output, State, clientside_callback
 )
 from dash.exceptions import PreventUpdate
+from flask import Response, jsonify, request, stream_with_context
 import pandas as pd
 from datetime import datetime
 
 from config import settings
+from database.connection import db_connection
+from database.freshness import freshness_watcher
+from database.queries import missing_dealer_sql_files
+from database.snapshots import snapshot_store
 from .components import (
     create_year_selector,
     create_age_group_selector,
@@ -22,28 +27,103 @@ from .constants import (
     get_mobis_code_options_by_region
 )
 from .functions import (
-    process_dataframe,
-    create_charts,
-    calculate_metrics,
+    create_table,
     get_available_years,
     get_current_year,
-    load_dashboard_data,
-    load_region_data,
+    get_dashboard_view,
+    view_charts,
     create_metrics_cards,
     create_charts_container,
     build_charts_container,
     create_dealer_display,
     create_holding_display,
-    create_region_display
+    create_region_display,
+    data_cache,
+    iter_dashboard_csv,
+    invalidate_changed_data
 )
 from .logging_config import logger
 from .templates import get_dashboard_template
+from .warmup import cache_warmer
 
 
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
 
 app.index_string = get_dashboard_template()
 
+
+@app.server.route('/stats/db-pool')
+def db_pool_stats():
+    """Отдает статистику пула соединений с БД для мониторинга"""
+    return jsonify(db_connection.pool_stats())
+
+
+@app.server.route('/export/csv')
+def export_csv_stream():
+    """
+    Потоковая выгрузка данных дашборда в CSV
+
+    Параметры запроса: year, age_group, mobis_code, holding, region
+    (по умолчанию — текущий год, 0-10Y и All). Ответ отдается порциями
+    (iter_dashboard_csv), поэтому память воркера не растет с размером
+    выгрузки.
+    """
+    args = request.args
+    selected_year = args.get('year', get_current_year(), type=int)
+    age_group = args.get('age_group', '0-10Y')
+    if age_group not in ('0-10Y', '0-5Y'):
+        return jsonify({'error': f'Неизвестная группа {age_group}'}), 400
+
+    current_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'dnm_data_export_{current_date}.csv'
+    chunks = iter_dashboard_csv(
+        selected_year, age_group, args.get('mobis_code', 'All'),
+        args.get('holding', 'All'), args.get('region', 'All')
+    )
+    return Response(
+        stream_with_context(chunks),
+        mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@app.server.route('/stats/cache')
+def cache_stats():
+    """Отдает статистику кеша данных для мониторинга"""
+    return jsonify({
+        **data_cache.stats(),
+        'freshness': freshness_watcher.stats(),
+        'warmup': cache_warmer.stats(),
+        'snapshots': snapshot_store.stats() if snapshot_store else None,
+    })
+
+
+# Выборка дилер × модель нужна только этим режимам; скрипты для нее
+# в репозиторий не входят
+if settings.app.data_grain == 'dealer' or snapshot_store is not None:
+    missing_sql = missing_dealer_sql_files()
+    if missing_sql and not settings.snapshot.offline:
+        logger.warning(
+            f'Нет SQL скриптов {", ".join(missing_sql)}: выборка дилер × '
+            f'модель и снимки недоступны, используются запросы по фильтрам'
+        )
+
+if settings.snapshot.offline:
+    # Без БД: ни отслеживания изменений, ни снимков, ни прогрева
+    # (список регионов и холдингов для прогрева берется из БД)
+    logger.warning('Офлайн-режим: данные читаются только из снимков')
+else:
+    # Изменения исходных данных сбрасывают только затронутые записи кеша
+    freshness_watcher.subscribe(invalidate_changed_data)
+    freshness_watcher.start()
+    # Снимки данных — источник при недоступности БД
+    if snapshot_store is not None:
+        snapshot_store.start()
+    # Прогрев частых представлений в фоне: сервер доступен сразу
+    if settings.warmup.enabled:
+        cache_warmer.start()
+
+
 available_years = get_available_years()
 current_year = get_current_year()
 
@@ -159,34 +239,23 @@ def update_dashboard(selected_year, age_group, selected_mobis_code,
         return [], [], [], [], [], []
 
     try:
-        df = load_dashboard_data(selected_year, age_group, selected_mobis_code,
-                                 selected_holding, selected_region)
-        logger.info(f'Данные дашборда загружены: {len(df)} строк')
+        # Обработанные данные, метрики и срезы — из общего представления
+        # (данные дилера и региона грузятся параллельно)
+        view = get_dashboard_view(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region
+        )
+        logger.info(f'Данные дашборда загружены: {len(view.frame)} строк')
     except Exception as e:
         logger.error(f'Ошибка при загрузке данных дашборда: {e}')
         return [], [], [], [], [], []
 
-    # Обрабатываем данные
-    logger.info('Обрабатываем данные дашборда')
-    df = process_dataframe(df)
-
-    # Загружаем данные по региону, если выбран конкретный дилер
-    region_df = None
-    if selected_mobis_code != 'All':
-        logger.info('Загружаем данные по региону')
-        region_df = load_region_data(selected_year, age_group,
-                                     selected_mobis_code)
-
     # Создаем графики с региональными данными
     logger.info('Создаем графики')
-    charts = create_charts(df, age_group, region_df, theme)
-
-    # Вычисляем метрики
-    logger.info('Вычисляем метрики')
-    metrics = calculate_metrics(df, age_group)
+    charts = view_charts(view, age_group, theme)
 
     # Создаем карты метрик
-    metrics_cards = create_metrics_cards(metrics, age_group)
+    metrics_cards = create_metrics_cards(view.metrics, age_group)
 
     # Создаем контейнеры графиков
     charts_container = create_charts_container(charts)
@@ -205,7 +274,7 @@ def update_dashboard(selected_year, age_group, selected_mobis_code,
                       else html.Div())
 
     logger.success('Дашборд успешно обновлен')
-    return (df.to_dict('records'), metrics_cards, charts_container,
+    return (view.records, metrics_cards, charts_container,
             dealer_display, holding_display, region_display)
 
 
@@ -279,16 +348,14 @@ def update_table(selected_year, age_group, selected_mobis_code,
     # По умолчанию скрываем колонки после PPR
     show_all_columns = False
 
-    # Загружаем данные
-    df = load_dashboard_data(selected_year, age_group, selected_mobis_code,
-                             selected_holding, selected_region)
+    # Берем представление, общее с update_dashboard (одна загрузка и
+    # обработка данных на набор фильтров)
+    view = get_dashboard_view(selected_year, age_group, selected_mobis_code,
+                              selected_holding, selected_region)
 
-    # Обрабатываем данные
-    df = process_dataframe(df)
-
-    # Создаем таблицу
-    from .functions import create_table
-    table = create_table(df, age_group, show_all_columns)
+    # Создаем таблицу из уже отсортированных строк
+    table = create_table(view.frame, age_group, show_all_columns,
+                         rows=view.table_rows)
 
     return table
 
@@ -303,6 +370,9 @@ def export_to_csv(n_clicks, data):
     """
     Экспортирует данные таблицы в CSV файл
 
+    Данные берутся из data-store (уже загруженное представление), без
+    запроса к БД. Большие выгрузки — потоком через /export/csv.
+
     Args:
         n_clicks: Количество кликов по кнопке
         data: Данные из data-store
@@ -1,12 +1,19 @@
 """
 Функции для обработки данных и создания компонентов DNM Dashboard
 """
+import contextvars
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
 import pandas as pd
 from datetime import datetime
-from functools import lru_cache
 from dash import html
 from loguru import logger
 
+from config import settings
+
 from .components import (
     create_metric_card,
     create_cards_row,
@@ -16,93 +23,192 @@ from .components import (
     create_holding_name_display,
     create_region_name_display
 )
-from .plotly_templates import build_dashboard_figures
+from .aggregation import (
+    AGE_BANDS,
+    age_0_5_sources,
+    aggregate_dealers,
+    derive_age_0_5,
+    select_mobis_codes
+)
+from .cache import PYARROW_AVAILABLE, ParquetStore, ResultCache
+from .cube import DealerCube
+from .metrics import compute_metric
+from .plotly_templates import (
+    add_ratio_column,
+    build_dashboard_figures,
+    rank_models
+)
 from .constants import (
     get_dealer_name,
     get_holding_name,
-    get_region_name,
-    get_holding_by_mobis_code,
-    get_region_by_mobis_code,
-    get_mobis_codes_by_holding
+    get_region_name
 )
 from database.queries import (
     get_dnm_data,
+    get_dnm_data_by_dealer,
+    iter_dnm_data,
 )
+from database.dealers import dealer_directory
+from database.schema import apply_dnm_schema
+from database.snapshots import snapshot_store
+
+
+# Ограниченный пул потоков для параллельных запросов дилера и региона
+_data_executor = ThreadPoolExecutor(
+    max_workers=settings.app.data_workers,
+    thread_name_prefix='dnm-data'
+)
+
+
+def _create_data_store():
+    """Общий для воркеров кеш на диске (если задан CACHE_PERSIST_DIR)"""
+    if not settings.cache.persist_dir:
+        return None
+    if not PYARROW_AVAILABLE:
+        logger.warning(
+            'pyarrow не установлен, кеш на диске отключен. '
+            'Установите: pip install pyarrow'
+        )
+        return None
+    return ParquetStore(settings.cache.persist_dir)
+
+
+def _persisted_key(key):
+    """Ключи с DataFrame, которые сохраняются в кеш на диске"""
+    return key[0] in ('dnm', 'dealer')
+
+
+# Кеш результатов DNM: ключи ('dnm', год, ...), ('dealer', год, группа),
+# ('cube', год, группа) и ('view', год, ...); на диск попадают только
+# DataFrame 'dnm' и 'dealer'
+data_cache = ResultCache(
+    'dnm-data',
+    max_bytes=settings.cache.max_bytes,
+    store=_create_data_store(),
+    stale_while_revalidate=settings.cache.stale_while_revalidate,
+    persist=_persisted_key
+)
+
+
+# Переименование колонок из выгрузок Excel / CSV
+_COLUMN_RENAMES = {'Model \\ Age': 'model', 'Model': 'model'}
+
+
+def _add_age_bands(df):
+    """
+    Добавляет недостающие возрастные диапазоны одной матричной сверткой
+
+    Колонки age_<год> берутся одним массивом и умножаются на матрицу
+    принадлежности возраста диапазону (AGE_BANDS), поэтому все
+    диапазоны считаются за один проход по данным.
+    """
+    missing = [band for band in AGE_BANDS if band not in df.columns]
+    if not missing:
+        return df
+
+    ages = [
+        col for col in dict.fromkeys(
+            age for band in missing for age in AGE_BANDS[band]
+        )
+        if col in df.columns
+    ]
+    bands = [
+        band for band in missing
+        if any(age in ages for age in AGE_BANDS[band])
+    ]
+    if not bands:
+        return df
+
+    membership = np.array(
+        [[age in AGE_BANDS[band] for band in bands] for age in ages],
+        dtype='int64'
+    )
+    values = (df[ages].to_numpy(dtype='int64') @ membership).astype('int32')
+    return df.assign(**{band: values[:, i] for i, band in enumerate(bands)})
 
 
 def process_dataframe(df):
     """
     Обрабатывает DataFrame для корректного отображения
 
+    Переименовывает колонки выгрузок, приводит типы по схеме и
+    добавляет недостающие возрастные диапазоны (0-3, 4-5, 6-10).
+
     Args:
         df: Исходный DataFrame
 
     Returns:
         pd.DataFrame: Обработанный DataFrame
     """
-    for col in df.columns[1:]:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
     if 'Unnamed: 1' in df.columns:
         df = df.drop(columns=['Unnamed: 1'])
 
-    if 'Model \\ Age' in df.columns:
-        df = df.rename(columns={'Model \\ Age': 'model'})
-
-    if 'Model' in df.columns:
-        df = df.rename(columns={'Model': 'model'})
-
-    # Создаем агрегированные колонки для 0-10Y
-    if 'age_0_3' not in df.columns:
-        cols_0_3 = [f'age_{y}' for y in range(0, 4)
-                    if f'age_{y}' in df.columns]
-        if cols_0_3:
-            df['age_0_3'] = df[cols_0_3].sum(axis=1)
-    if 'age_4_5' not in df.columns:
-        cols_4_5 = [f'age_{y}' for y in range(4, 6)
-                    if f'age_{y}' in df.columns]
-        if cols_4_5:
-            df['age_4_5'] = df[cols_4_5].sum(axis=1)
-    if 'age_6_10' not in df.columns:
-        cols_6_10 = [f'age_{y}' for y in range(6, 11)
-                     if f'age_{y}' in df.columns]
-        if cols_6_10:
-            df['age_6_10'] = df[cols_6_10].sum(axis=1)
-
-    # Создаем агрегированные колонки для 0-5Y (используем age_0_3 и age_4_5)
-    if 'age_0_3' not in df.columns:
-        cols_0_3 = [f'age_{y}' for y in range(0, 4)
-                    if f'age_{y}' in df.columns]
-        if cols_0_3:
-            df['age_0_3'] = df[cols_0_3].sum(axis=1)
-    if 'age_4_5' not in df.columns:
-        cols_4_5 = [f'age_{y}' for y in range(4, 6)
-                    if f'age_{y}' in df.columns]
-        if cols_4_5:
-            df['age_4_5'] = df[cols_4_5].sum(axis=1)
+    renames = {
+        col: name for col, name in _COLUMN_RENAMES.items()
+        if col in df.columns
+    }
+    if renames:
+        df = df.rename(columns=renames)
 
-    return df
+    # Данные из БД уже типизированы при получении; здесь схема
+    # применяется только к оставшимся колонкам
+    df = apply_dnm_schema(df)
+    return _add_age_bands(df)
 
 
-def create_charts(df, age_group='0-10Y', region_df=None, theme='dark'):
+def create_charts(df, age_group='0-10Y', region_df=None, theme='dark',
+                  ranked=None):
     """Создаёт все 6 тематизированных графиков.
 
     Делегирует построение в
     plotly_templates.build_dashboard_figures, который применяет
     дизайн-систему (ранжированная прозрачность, значения над
     столбцами, оверлей Region Average, stacked age-groups с линией
-    AVG UIO) и поддерживает тёмную и светлую темы.
+    AVG UIO) и поддерживает тёмную и светлую темы. ranked — готовые
+    топ-срезы моделей из DashboardView; без них топ-N (TOP_MODELS)
+    выбирается здесь.
     """
-    return build_dashboard_figures(df, age_group, region_df, theme)
+    return build_dashboard_figures(df, age_group, region_df, theme, ranked,
+                                   top=settings.app.top_models)
 
 
-def create_table(df, age_group='0-10Y', show_all_columns=False):
+def table_rows(df, age_group='0-10Y'):
+    """
+    Строки таблицы: модели с RO и суммой, по убыванию total_ro_cost
+
+    Args:
+        df: DataFrame с данными
+        age_group: Выбранная возрастная группа
+
+    Returns:
+        list: Записи для DataTable
+    """
+    df_table = df
+    total_col = 'total_0_5' if age_group == '0-5Y' else 'total_0_10'
+
+    # Фильтруем строки с валидными данными
+    if total_col in df_table.columns:
+        df_table = df_table[df_table[total_col] > 0]
+
+    # Убираем строки с пустыми или нулевыми значениями в ключевых колонках
+    if 'total_ro_cost' in df_table.columns:
+        df_table = df_table[df_table['total_ro_cost'] > 0]
+
+    # Сортируем по total_ro_cost
+    if 'total_ro_cost' in df_table.columns:
+        df_table = df_table.sort_values('total_ro_cost', ascending=False)
+
+    return df_table.to_dict('records')
+
+
+def create_table(df, age_group='0-10Y', show_all_columns=False, rows=None):
     """
     Создает таблицу данных с фильтрацией, зеброй и скрытием колонок
 
     Args:
         df: DataFrame с данными
         age_group: Выбранная возрастная группа
+        rows: Готовые строки таблицы (table_rows); None — посчитать
 
     Returns:
         dash_table.DataTable: Таблица данных
@@ -133,7 +239,8 @@ def create_table(df, age_group='0-10Y', show_all_columns=False):
             'age_4_5': '4-5Y',
             'pct_age_0_3': 'Ratio 0-3Y',
             'pct_age_4_5': 'Ratio 4-5Y',
-            'ro_ratio_of_uio_5y': 'RO ratio from UIO 5Y'
+            'ro_ratio_of_uio_5y': 'RO ratio from UIO 5Y',
+            'ro_ratio_of_avg_uio_5y': 'RO ratio from AVG UIO 5Y'
         }
     else:
         column_rename = {
@@ -224,24 +331,10 @@ def create_table(df, age_group='0-10Y', show_all_columns=False):
         else:
             columns.append({'name': display_name, 'id': col})
 
-    # Фильтруем строки и сортируем по total_ro_cost
-    df_table = df.copy()
-    total_col = 'total_0_5' if age_group == '0-5Y' else 'total_0_10'
+    if rows is None:
+        rows = table_rows(df, age_group)
 
-    # Фильтруем строки с валидными данными
-    if total_col in df_table.columns:
-        df_table = df_table[df_table[total_col] > 0]
-
-    # Убираем строки с пустыми или нулевыми значениями в ключевых колонках
-    if 'total_ro_cost' in df_table.columns:
-        df_table = df_table[df_table['total_ro_cost'] > 0]
-
-    # Сортируем по total_ro_cost
-    if 'total_ro_cost' in df_table.columns:
-        df_table = df_table.sort_values('total_ro_cost', ascending=False)
-
-    result = create_data_table(columns, df_table.to_dict('records'),
-                               show_all_columns)
+    result = create_data_table(columns, rows, show_all_columns)
     return result
 
 
@@ -275,14 +368,18 @@ def calculate_metrics(df, age_group='0-10Y'):
     else:
         total_uio = 0
     total_ro_qty = df[total_col].sum() if total_col in df.columns else 0
-    total_cost = (df['total_ro_cost'].sum()
+    # Суммы с плавающей точкой накапливаются в float64
+    total_cost = (df['total_ro_cost'].astype('float64').sum()
                   if 'total_ro_cost' in df.columns else 0)
     total_labor_hours = (
-        df[labor_hours_col].sum()
+        df[labor_hours_col].astype('float64').sum()
         if labor_hours_col in df.columns else 0
     )
-    avg_ro_cost = (total_cost / total_ro_qty
-                   if total_ro_qty > 0 else 0)
+    avg_ro_cost = float(compute_metric(
+        'avg_ro_cost',
+        {'total_ro_cost': total_cost, total_col: total_ro_qty},
+        age_group
+    ))
 
     return {
         'total_uio': total_uio,
@@ -315,42 +412,301 @@ def get_current_year():
     return datetime.now().year
 
 
-@lru_cache(maxsize=64)
+# Выводятся ли данные 0-5Y из результата 0-10Y, по источнику
+# (скрипты dnm_script_age_0_10[_by_region|_by_dealer].sql отдают
+# разные колонки); отсутствие ключа — источник еще не проверяли
+_age_0_5_derivable = {}
+
+
+def _derive_age_0_5_from(source, superset_key):
+    """
+    Пытается получить данные 0-5Y из закешированного результата 0-10Y
+
+    Результат 0-10Y ради этого не загружается: используется, только
+    если он уже есть в data_cache, а колонки проверяются до расчета
+    (age_0_5_sources). Итог проверки запоминается для источника.
+
+    Args:
+        source: Источник результата ('model', 'region' или 'dealer')
+        superset_key: Ключ результата 0-10Y в data_cache
+
+    Returns:
+        pd.DataFrame | None: Данные 0-5Y или None, если нужен
+                             отдельный запрос
+    """
+    if _age_0_5_derivable.get(source) is False:
+        return None
+    if superset_key not in data_cache:
+        return None
+    superset = data_cache.get(superset_key)
+    if superset is None:
+        return None
+
+    derivable = age_0_5_sources(superset.columns) is not None
+    if _age_0_5_derivable.get(source) is None:
+        _age_0_5_derivable[source] = derivable
+        if derivable:
+            logger.info(f'Данные 0-5Y ({source}) выводятся из 0-10Y')
+        else:
+            logger.info(
+                f'В результате 0-10Y ({source}) нет колонок по возрастам '
+                f'для 0-5Y, используем отдельный запрос'
+            )
+    if not derivable:
+        return None
+    return derive_age_0_5(superset)
+
+
+def _year_ttl(selected_year):
+    """
+    Время жизни кешированных данных года
+
+    Данные закрытых (прошлых) лет не меняются и хранятся без TTL.
+    Данные текущего года живут CACHE_CURRENT_YEAR_TTL секунд.
+
+    Returns:
+        int: TTL в секундах (0 — без ограничения)
+    """
+    if int(selected_year) < get_current_year():
+        return 0
+    return settings.cache.current_year_ttl
+
+
 def _cached_dnm_data(selected_year, age_group, selected_mobis_code,
                      selected_holding, selected_region, group_by_region):
     """Кешируемая обёртка над тяжёлым SQL-запросом get_dnm_data.
 
-    Все аргументы хешируемы (скаляры). Результат кешируется, поэтому
-    повторные вызовы с теми же параметрами (например, при смене темы)
-    не идут в БД. Вызывающий код обязан копировать DataFrame перед
-    мутацией, чтобы не портить кеш.
+    Результат хранится в data_cache, поэтому повторные вызовы с теми
+    же параметрами (например, при смене темы) не идут в БД, а
+    одновременные промахи по одному ключу выполняют запрос один раз.
+    DataFrame отдается только для чтения (см. app/cache.py). Данные 0-5Y
+    по возможности выводятся из уже закешированного результата 0-10Y
+    без второго запроса.
     """
-    return get_dnm_data(
-        selected_year, age_group, selected_mobis_code,
-        selected_holding, selected_region,
-        group_by_region=group_by_region
+    def load():
+        if age_group == '0-5Y':
+            df = _derive_age_0_5_from(
+                'region' if group_by_region else 'model',
+                ('dnm', selected_year, '0-10Y', selected_mobis_code,
+                 selected_holding, selected_region, group_by_region)
+            )
+            if df is not None:
+                return df
+        return get_dnm_data(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region,
+            group_by_region=group_by_region
+        )
+
+    key = ('dnm', selected_year, age_group, selected_mobis_code,
+           selected_holding, selected_region, group_by_region)
+    return data_cache.get_or_load(key, load, ttl=_year_ttl(selected_year))
+
+
+def _cached_dealer_frame(selected_year, age_group):
+    """Кешируемая выборка дилер × модель за год и возрастную группу.
+
+    Один запрос на (год, возрастная группа); любые фильтры по дилеру,
+    холдингу и региону считаются из него в памяти; 0-5Y по возможности
+    выводится из уже закешированной выборки 0-10Y.
+    """
+    def load():
+        if age_group == '0-5Y':
+            df = _derive_age_0_5_from(
+                'dealer', ('dealer', selected_year, '0-10Y')
+            )
+            if df is not None:
+                return df
+        return get_dnm_data_by_dealer(selected_year, age_group)
+
+    return data_cache.get_or_load(
+        ('dealer', selected_year, age_group), load,
+        ttl=_year_ttl(selected_year)
     )
 
 
-def load_dashboard_data(selected_year, age_group, selected_mobis_code,
-                        selected_holding, selected_region='All'):
+def _cached_dealer_cube(selected_year, age_group):
     """
-    Загружает данные для дашборда с автоматическим определением региона
+    Кешируемый куб дилер × модель × показатель за год и группу
+
+    Строится один раз из выборки дилер × модель; выбор фильтров
+    считается суммой по маске дилеров (DealerCube.rollup).
+    """
+    return data_cache.get_or_load(
+        ('cube', selected_year, age_group),
+        lambda: DealerCube(
+            _cached_dealer_frame(selected_year, age_group), age_group
+        ),
+        ttl=_year_ttl(selected_year)
+    )
+
+
+def invalidate_data_cache(selected_year=None):
+    """
+    Сбрасывает закешированные данные DNM
+
+    Args:
+        selected_year: Год, данные которого нужно сбросить
+                       (None — весь кеш)
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    if selected_year is None:
+        return data_cache.invalidate()
+    return data_cache.invalidate(lambda key: key[1] == selected_year)
+
+
+def _key_covers_dealers(key, mobis_codes):
+    """Входит ли хотя бы один из дилеров в выборку ключа кеша"""
+    if mobis_codes is None or key[0] in ('dealer', 'cube'):
+        return True
+    selected_mobis_code, selected_holding, selected_region = key[3:6]
+    if key[0] == 'view' and selected_mobis_code != 'All':
+        # Представление дилера содержит и средние по его региону
+        region = dealer_directory.region_of(selected_mobis_code)
+        if any(dealer_directory.region_of(mobis_code) == region
+               for mobis_code in mobis_codes):
+            return True
+    for mobis_code in mobis_codes:
+        if selected_mobis_code not in ('All', mobis_code):
+            continue
+        if (selected_holding != 'All' and
+                dealer_directory.holding_of(mobis_code) != selected_holding):
+            continue
+        if (selected_region != 'All' and
+                dealer_directory.region_of(mobis_code) != selected_region):
+            continue
+        return True
+    return False
+
+
+def invalidate_changed_data(changes):
+    """
+    Сбрасывает записи кеша, затронутые изменением исходных данных
+
+    Сбрасываются только записи нужного года, в выборку которых входит
+    хотя бы один изменившийся дилер (с учетом Holding и Region).
+
+    Args:
+        changes: {год: множество mobis_code} от FreshnessWatcher;
+                 год None — все годы, множество None — все дилеры
+
+    Returns:
+        int: Количество удаленных записей
+    """
+    removed = 0
+    for year, mobis_codes in changes.items():
+        def affected(key, year=year, mobis_codes=mobis_codes):
+            if year is not None and int(key[1]) != year:
+                return False
+            return _key_covers_dealers(key, mobis_codes)
+        removed += data_cache.invalidate(affected)
+    return removed
+
+
+def _load_dealer_slice(selected_year, age_group, selected_mobis_code,
+                       selected_holding, selected_region):
+    """
+    Считает данные для выбранных фильтров по кубу дилер × модель
+
+    Returns:
+        pd.DataFrame | None: Агрегированные данные или None, если
+                             выборку по дилерам получить не удалось
+    """
+    try:
+        cube = _cached_dealer_cube(selected_year, age_group)
+        mobis_codes = select_mobis_codes(
+            selected_mobis_code, selected_holding, selected_region
+        )
+    except Exception as e:
+        logger.warning(f'Выборка по дилерам недоступна, используем '
+                       f'запрос по фильтрам: {e}')
+        return None
+    return cube.rollup(mobis_codes)
+
+
+def _ensure_snapshot_dealers():
+    """
+    Загружает справочник дилеров из снимка, если БД недоступна
+    или включен офлайн-режим
+
+    Returns:
+        bool: Доступен ли справочник дилеров
+    """
+    if dealer_directory.loaded:
+        return True
+    try:
+        if settings.snapshot.offline:
+            raise RuntimeError('включен офлайн-режим')
+        dealer_directory.ensure_loaded()
+    except Exception as e:
+        dealers = snapshot_store.dealers()
+        if dealers is None:
+            logger.error(f'Справочник дилеров недоступен: {e}')
+            return False
+        logger.warning(f'Справочник дилеров загружен из снимка: {e}')
+        dealer_directory.load_frame(dealers)
+        if not settings.snapshot.offline:
+            # Справочник перечитается из БД, когда она станет доступна
+            dealer_directory.start_refresh()
+    return True
+
+
+def _load_snapshot_slice(selected_year, age_group, selected_mobis_code,
+                         selected_holding, selected_region):
+    """
+    Считает данные для выбранных фильтров из снимка на диске
+
+    Если справочник дилеров недоступен (БД не отвечает или включен
+    офлайн-режим), он загружается из снимка.
+
+    Returns:
+        pd.DataFrame | None: Агрегированные данные или None, если
+                             снимка нет
+    """
+    if snapshot_store is None:
+        return None
+    frame = snapshot_store.dnm_frame(selected_year, age_group)
+    if frame is None:
+        logger.warning(
+            f'Нет снимка данных за {selected_year} ({age_group})'
+        )
+        return None
+
+    if not _ensure_snapshot_dealers():
+        return None
+
+    mobis_codes = select_mobis_codes(
+        selected_mobis_code, selected_holding, selected_region
+    )
+    return aggregate_dealers(frame, mobis_codes, age_group)
+
+
+def resolve_filters(selected_mobis_code, selected_holding,
+                    selected_region='All'):
+    """
+    Приводит выбранные фильтры к параметрам запроса DNM
+
+    Определяет регион по выбранному дилеру и сбрасывает Mobis Code,
+    если он не относится к выбранному Holding.
 
     Args:
-        selected_year: Выбранный год
-        age_group: Выбранная возрастная группа
         selected_mobis_code: Выбранный код дилера
         selected_holding: Выбранный holding
         selected_region: Выбранный region
 
     Returns:
-        pd.DataFrame: DataFrame с данными
+        tuple: (mobis_code, holding, region) для запроса
     """
+    # Справочник дилеров может прийти из снимка (офлайн или БД недоступна)
+    directory_ready = _ensure_snapshot_dealers()
+
     # НОВАЯ ЛОГИКА: Автоматически определяем регион по mobis_code
     if selected_mobis_code != 'All':
         # Определяем регион по выбранному дилеру
-        auto_region = get_region_by_mobis_code(selected_mobis_code)
+        auto_region = (dealer_directory.region_of(selected_mobis_code)
+                       if directory_ready else '')
         if auto_region:
             selected_region = auto_region
             logger.info(f'Автоматически определен регион: {auto_region} '
@@ -366,40 +722,144 @@ def load_dashboard_data(selected_year, age_group, selected_mobis_code,
             selected_region = 'All'
 
     # Проверяем совместимость выбранного Mobis Code с Holding
-    if (selected_holding != 'All' and
+    if (directory_ready and
+        selected_holding != 'All' and
         selected_mobis_code != 'All' and
-        selected_mobis_code not in get_mobis_codes_by_holding(
+        selected_mobis_code not in dealer_directory.mobis_codes_by_holding(
             selected_holding)):
         # Если выбранный Mobis Code не соответствует Holding,
         # используем 'All' для Mobis Code
         selected_mobis_code = 'All'
 
-    try:
-        # Получаем данные для выбранного года, возрастной группы,
-        # кода дилера, holding и автоматически определенного region
-        # (через кеш; копируем, т.к. дальше данные мутируются)
-        df = _cached_dnm_data(
+    return selected_mobis_code, selected_holding, selected_region
+
+
+def load_dashboard_data(selected_year, age_group, selected_mobis_code,
+                        selected_holding, selected_region='All'):
+    """
+    Загружает данные для дашборда с автоматическим определением региона
+
+    Args:
+        selected_year: Выбранный год
+        age_group: Выбранная возрастная группа
+        selected_mobis_code: Выбранный код дилера
+        selected_holding: Выбранный holding
+        selected_region: Выбранный region
+
+    Returns:
+        pd.DataFrame: DataFrame с данными
+    """
+    selected_mobis_code, selected_holding, selected_region = resolve_filters(
+        selected_mobis_code, selected_holding, selected_region
+    )
+
+    if settings.snapshot.offline:
+        df = _load_snapshot_slice(
             selected_year, age_group, selected_mobis_code,
-            selected_holding, selected_region, False
-        ).copy()
-    except Exception:
-        # Fallback на CSV файл в случае ошибки
-        if selected_year == 2024:
-            # Используем июль 2025 как 2024
-            df = pd.read_csv('data/jul_25.csv')
-        else:
-            # Используем август 2025 как 2025
-            df = pd.read_csv('data/aug_25.csv')
+            selected_holding, selected_region
+        )
+        if df is None:
+            raise RuntimeError(
+                f'Офлайн-режим: нет снимка данных за {selected_year} '
+                f'({age_group})'
+            )
+        return df
 
-        # Добавляем пустую колонку UIO для fallback данных
-        df['uio'] = 0
+    try:
+        df = None
+        if settings.app.data_grain == 'dealer':
+            # Агрегируем в памяти из выборки дилер × модель
+            df = _load_dealer_slice(
+                selected_year, age_group, selected_mobis_code,
+                selected_holding, selected_region
+            )
+        if df is None:
+            # Получаем данные для выбранного года, возрастной группы,
+            # кода дилера, holding и автоматически определенного region
+            # (через кеш; массивы кеша недоступны для записи)
+            df = _cached_dnm_data(
+                selected_year, age_group, selected_mobis_code,
+                selected_holding, selected_region, False
+            )
+    except Exception as e:
+        # БД недоступна — считаем данные из последнего снимка
+        logger.error(f'Ошибка загрузки данных из БД, используем снимок: {e}')
+        df = _load_snapshot_slice(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region
+        )
+        if df is None:
+            raise
 
     return df
 
 
+def _region_average(selected_year, age_group, region):
+    """
+    Средние по дилерам региона из выборки дилер × модель
+
+    Выборка используется, только если она уже нужна дашборду
+    (DATA_GRAIN=dealer) или уже есть в кеше: загружать ее по всей
+    стране ради одного региона дороже запроса *_by_region. В
+    офлайн-режиме используется снимок.
+
+    Returns:
+        pd.DataFrame | None: Средние на дилера по моделям или None,
+                             если выборка недоступна
+    """
+    if settings.snapshot.offline:
+        frame = (snapshot_store.dnm_frame(selected_year, age_group)
+                 if snapshot_store is not None else None)
+        if frame is None or not _ensure_snapshot_dealers():
+            return None
+        cube = DealerCube(frame, age_group)
+    elif (settings.app.data_grain == 'dealer'
+          or ('cube', selected_year, age_group) in data_cache
+          or ('dealer', selected_year, age_group) in data_cache):
+        cube = _cached_dealer_cube(selected_year, age_group)
+    else:
+        return None
+    return cube.rollup(
+        dealer_directory.mobis_codes_by_region(region), average=True
+    )
+
+
+def _cross_check_region(df, selected_year, age_group, region):
+    """Сравнивает локальные средние региона с запросом *_by_region"""
+    try:
+        sql_df = _cached_dnm_data(
+            selected_year, age_group, 'All', 'All', region, True
+        )
+    except Exception as e:
+        logger.warning(f'Сверка региона {region} не выполнена: {e}')
+        return
+    merged = df.merge(
+        sql_df, on='model', suffixes=('', '_sql'), how='inner'
+    )
+    deviations = {}
+    for col in df.columns:
+        if f'{col}_sql' not in merged.columns:
+            continue
+        local = merged[col].to_numpy(dtype='float64')
+        remote = merged[f'{col}_sql'].to_numpy(dtype='float64')
+        scale = np.maximum(np.abs(remote), 1.0)
+        deviations[col] = float(np.max(np.abs(local - remote) / scale,
+                                       initial=0.0))
+    worst = max(deviations, key=deviations.get, default=None)
+    logger.info(
+        f'Сверка региона {region}: {len(merged)} моделей, '
+        f'макс. отклонение {deviations.get(worst, 0.0):.2%} ({worst})'
+    )
+
+
 def load_region_data(selected_year, age_group, selected_mobis_code):
     """
-    Загружает данные по региону выбранного дилера (НОВАЯ ЛОГИКА)
+    Загружает средние по региону выбранного дилера
+
+    Средние считаются в памяти по дилерам региона из выборки
+    дилер × модель, если она уже загружена (DATA_GRAIN=dealer или
+    кеш); иначе — запросом *_by_region (он же для сверки,
+    REGION_CROSS_CHECK).
 
     Args:
         selected_year: Выбранный год
@@ -409,31 +869,255 @@ def load_region_data(selected_year, age_group, selected_mobis_code):
     Returns:
         pd.DataFrame: Данные по региону
     """
+    # Определяем регион по mobis_code
+    region = (dealer_directory.region_of(selected_mobis_code)
+              if _ensure_snapshot_dealers() else '')
+    if not region:
+        logger.warning(f'Не удалось определить регион для дилера '
+                       f'{selected_mobis_code}')
+        return pd.DataFrame()
+
+    logger.info(f'Получаем данные по региону {region} для дилера '
+                f'{selected_mobis_code}')
+
     try:
-        # Определяем регион по mobis_code
-        region = get_region_by_mobis_code(selected_mobis_code)
-        if not region:
-            logger.warning(f'Не удалось определить регион для дилера '
-                           f'{selected_mobis_code}')
-            return pd.DataFrame()
+        df = _region_average(selected_year, age_group, region)
+    except Exception as e:
+        logger.warning(f'Выборка по дилерам недоступна для региона '
+                       f'{region}: {e}')
+        df = None
+
+    if df is not None:
+        if settings.app.region_cross_check:
+            _cross_check_region(df, selected_year, age_group, region)
+        return df
 
-        logger.info(f'Получаем данные по региону {region} для дилера '
-                    f'{selected_mobis_code}')
+    if settings.snapshot.offline:
+        logger.info('Офлайн-режим: нет снимка для данных по региону')
+        return pd.DataFrame()
 
-        # Получаем данные по региону (через кеш; копируем перед отдачей)
-        df = _cached_dnm_data(
+    try:
+        # Запасной путь: отдельный запрос с группировкой по региону
+        return _cached_dnm_data(
             selected_year, age_group,
             'All',     # Все дилеры в регионе
             'All',     # Все холдинги в регионе
             region,    # Конкретный регион
             True       # Группировка по региону
-        ).copy()
-        return df
+        )
     except Exception as e:
         logger.error(f'Ошибка при получении данных по региону: {e}')
         return pd.DataFrame()
 
 
+def _submit(fn, *args):
+    """Отправляет fn в пул потоков в копии текущего контекста, чтобы
+    фоновое обновление представления не получило устаревшие данные"""
+    return _data_executor.submit(contextvars.copy_context().run, fn, *args)
+
+
+def load_dashboard_bundle(selected_year, age_group, selected_mobis_code,
+                          selected_holding, selected_region='All'):
+    """
+    Загружает данные дашборда и данные по региону дилера параллельно
+
+    Оба запроса независимы, поэтому при выбранном дилере они уходят
+    в БД одновременно через общий ограниченный пул потоков.
+
+    Args:
+        selected_year: Выбранный год
+        age_group: Выбранная возрастная группа
+        selected_mobis_code: Выбранный код дилера
+        selected_holding: Выбранный holding
+        selected_region: Выбранный region
+
+    Returns:
+        tuple: (DataFrame с данными, DataFrame по региону или None)
+    """
+    df_future = _submit(
+        load_dashboard_data, selected_year, age_group,
+        selected_mobis_code, selected_holding, selected_region
+    )
+
+    region_df = None
+    if selected_mobis_code != 'All':
+        region_future = _submit(
+            load_region_data, selected_year, age_group, selected_mobis_code
+        )
+        region_df = region_future.result()
+
+    return df_future.result(), region_df
+
+
+class DashboardView(namedtuple('DashboardView', [
+    'frame', 'region_frame', 'metrics', 'ranked', 'records', 'table_rows'
+])):
+    """
+    Обработанное представление дашборда для одного набора фильтров
+
+    Поля:
+        frame: Обработанный DataFrame (с производной долей 0-5Y)
+        region_frame: Данные по региону дилера или None
+        metrics: Итоги для карт (calculate_metrics)
+        ranked: Топ-срезы моделей по колонкам графиков
+        records: Записи frame для data-store
+        table_rows: Отфильтрованные и отсортированные строки таблицы
+
+    Общее для всех колбэков и хранится в data_cache; поля не
+    изменяются.
+    """
+
+    __slots__ = ()
+
+    @property
+    def nbytes(self) -> int:
+        """Оценка размера представления в байтах (для бюджета кеша)"""
+        frames = [self.frame, self.region_frame, *self.ranked.values()]
+        nbytes = sum(
+            int(frame.memory_usage(deep=True).sum())
+            for frame in frames if frame is not None
+        )
+        for rows in (self.records, self.table_rows):
+            if rows:
+                nbytes += len(rows) * (
+                    sys.getsizeof(rows[0]) + 32 * len(rows[0])
+                )
+        return nbytes
+
+
+def build_dashboard_view(df, age_group='0-10Y', region_df=None):
+    """
+    Обрабатывает данные и считает все, что нужно колбэкам дашборда
+
+    Args:
+        df: Данные дашборда (load_dashboard_data)
+        age_group: Выбранная возрастная группа
+        region_df: Данные по региону дилера или None
+
+    Returns:
+        DashboardView: Представление дашборда
+    """
+    df = add_ratio_column(process_dataframe(df), age_group)
+    region_df = add_ratio_column(region_df, age_group)
+    return DashboardView(
+        frame=df,
+        region_frame=region_df,
+        metrics=calculate_metrics(df, age_group),
+        ranked=rank_models(df, age_group, settings.app.top_models),
+        records=df.to_dict('records'),
+        table_rows=table_rows(df, age_group),
+    )
+
+
+def get_dashboard_view(selected_year, age_group, selected_mobis_code,
+                       selected_holding, selected_region='All'):
+    """
+    Кешируемое представление дашборда для выбранных фильтров
+
+    Карты, графики (в любой теме) и таблица строятся из одного
+    представления: данные загружаются и обрабатываются один раз на
+    набор фильтров, одновременные колбэки ждут одну сборку. Запись
+    сбрасывается вместе с данными (invalidate_data_cache,
+    invalidate_changed_data). При фоновом обновлении истекшего
+    представления данные под ним тоже загружаются заново, а не
+    берутся из истекших записей. Если данные по региону дилера
+    получить не удалось, представление живет не дольше данных
+    текущего года.
+
+    Returns:
+        DashboardView: Представление дашборда
+    """
+    key = ('view', selected_year, age_group, selected_mobis_code,
+           selected_holding, selected_region)
+    degraded = []
+
+    def load():
+        df, region_df = load_dashboard_bundle(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region
+        )
+        if region_df is not None and region_df.empty:
+            degraded.append(key)
+        return build_dashboard_view(df, age_group, region_df)
+
+    view = data_cache.get_or_load(key, load, ttl=_year_ttl(selected_year))
+    if degraded:
+        data_cache.set(key, view, ttl=settings.cache.current_year_ttl)
+    return view
+
+
+def view_charts(view, age_group='0-10Y', theme='dark'):
+    """Графики дашборда из представления в выбранной теме"""
+    return create_charts(view.frame, age_group, view.region_frame, theme,
+                         view.ranked)
+
+
+def iter_dashboard_data(selected_year, age_group, selected_mobis_code,
+                        selected_holding, selected_region='All',
+                        chunksize=None):
+    """
+    Отдает обработанные данные дашборда порциями прямо из БД
+
+    Фильтры приводятся так же, как в load_dashboard_data, но результат
+    не кешируется и не собирается целиком в памяти. Колонки порций
+    совпадают с колонками представления (DashboardView.frame).
+
+    Args:
+        selected_year: Выбранный год
+        age_group: Выбранная возрастная группа
+        selected_mobis_code: Выбранный код дилера
+        selected_holding: Выбранный holding
+        selected_region: Выбранный region
+        chunksize: Размер порции строк
+
+    Yields:
+        pd.DataFrame: Очередная обработанная порция данных
+    """
+    selected_mobis_code, selected_holding, selected_region = resolve_filters(
+        selected_mobis_code, selected_holding, selected_region
+    )
+    for chunk in iter_dnm_data(
+        selected_year, age_group, selected_mobis_code,
+        selected_holding, selected_region, chunksize=chunksize
+    ):
+        yield add_ratio_column(process_dataframe(chunk), age_group)
+
+
+def iter_dashboard_csv(selected_year, age_group, selected_mobis_code,
+                       selected_holding, selected_region='All',
+                       chunksize=None):
+    """
+    Отдает CSV с данными дашборда порциями текста
+
+    Если представление для фильтров уже в кеше (или включен
+    офлайн-режим), CSV режется из него без запроса к БД. Иначе
+    данные читаются из БД порциями через server-side cursor, и в
+    памяти одновременно держится только одна порция.
+
+    Yields:
+        str: Очередная порция CSV (первая — с заголовком)
+    """
+    key = ('view', selected_year, age_group, selected_mobis_code,
+           selected_holding, selected_region)
+    if settings.snapshot.offline or key in data_cache:
+        frame = get_dashboard_view(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region
+        ).frame
+        size = chunksize or settings.database.chunk_size
+        chunks = (
+            frame.iloc[start:start + size]
+            for start in range(0, max(len(frame), 1), size)
+        )
+    else:
+        chunks = iter_dashboard_data(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region, chunksize
+        )
+    for i, chunk in enumerate(chunks):
+        yield chunk.to_csv(header=(i == 0), index=False)
+
+
 def create_metrics_cards(metrics, age_group):
     """
     Создает карты с метриками
@@ -494,20 +1178,15 @@ def build_charts_container(selected_year, age_group, selected_mobis_code,
                            selected_holding, selected_region, theme):
     """Собирает контейнер графиков из (кешированных) данных под тему.
 
-    Используется колбэком смены темы: загрузка идёт через кеш, поэтому
-    повторная сборка мгновенна и без обращения к БД.
+    Используется колбэком смены темы: представление берется из кеша
+    (get_dashboard_view), поэтому заново строятся только фигуры — без
+    обращения к БД и повторной обработки данных.
     """
-    df = load_dashboard_data(selected_year, age_group, selected_mobis_code,
-                             selected_holding, selected_region)
-    df = process_dataframe(df)
-
-    region_df = None
-    if selected_mobis_code != 'All':
-        region_df = load_region_data(selected_year, age_group,
-                                     selected_mobis_code)
-
-    charts = create_charts(df, age_group, region_df, theme)
-    return create_charts_container(charts)
+    view = get_dashboard_view(
+        selected_year, age_group, selected_mobis_code,
+        selected_holding, selected_region
+    )
+    return create_charts_container(view_charts(view, age_group, theme))
 
 
 def create_dealer_display(selected_mobis_code):
@@ -521,8 +1200,11 @@ def create_dealer_display(selected_mobis_code):
         html.Div: Компонент отображения дилера с дополнительной информацией
     """
     dealer_name = get_dealer_name(selected_mobis_code)
-    holding = get_holding_by_mobis_code(selected_mobis_code)
-    region = get_region_by_mobis_code(selected_mobis_code)
+    if _ensure_snapshot_dealers():
+        holding = dealer_directory.holding_of(selected_mobis_code)
+        region = dealer_directory.region_of(selected_mobis_code)
+    else:
+        holding = region = ''
 
     # Создаем основной контейнер
     if not dealer_name:
@@ -0,0 +1,112 @@
+"""
+Производные показатели DNM
+
+Каждый показатель задан одним определением: числитель, знаменатель,
+множитель, округление и значение при нулевом знаменателе. Показатели
+считаются векторно (numpy) для DataFrame любого размера или для
+словаря итогов; определения общие для агрегации, карт метрик,
+графиков и таблицы.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+# numerator / denominator — имена колонок; {suffix} заменяется на
+# 0_5 или 0_10 по возрастной группе. Значение равно
+# numerator * scale / denominator, округленному до decimals знаков
+# (None — без округления); при denominator <= 0 — default.
+Metric = namedtuple(
+    'Metric',
+    ['numerator', 'denominator', 'scale', 'decimals', 'default'],
+    defaults=(1.0, None, 0.0)
+)
+
+DERIVED_METRICS = {
+    # Средние на RO
+    'avg_ro_cost': Metric('total_ro_cost', 'total_{suffix}'),
+    'aver_labor_hours_per_vhc': Metric(
+        'labor_hours_{suffix}', 'total_{suffix}'
+    ),
+    'avg_ro_labor_cost': Metric('labor_amount_{suffix}', 'total_{suffix}'),
+    'avg_ro_part_cost': Metric('parts_amount_{suffix}', 'total_{suffix}'),
+    # Доли возрастных диапазонов, %
+    'pct_age_0_3': Metric('age_0_3', 'total_{suffix}', 100, 2),
+    'pct_age_4_5': Metric('age_4_5', 'total_{suffix}', 100, 2),
+    'pct_age_6_10': Metric('age_6_10', 'total_{suffix}', 100, 2),
+    # RO / UIO, %
+    'ro_ratio_of_uio_10y': Metric('total_0_10', 'uio_10y', 100, 2),
+    'ro_ratio_of_uio_5y': Metric('total_0_5', 'uio_5y', 100, 2),
+    'ro_ratio_of_avg_uio_5y': Metric('total_0_5', 'avg_uio_5y', 100, 2),
+}
+
+
+def _suffix(age_group):
+    return '0_5' if age_group == '0-5Y' else '0_10'
+
+
+def metric_sources(name, age_group='0-10Y'):
+    """
+    Колонки числителя и знаменателя показателя
+
+    Returns:
+        tuple: (числитель, знаменатель)
+    """
+    metric = DERIVED_METRICS[name]
+    suffix = _suffix(age_group)
+    return (metric.numerator.format(suffix=suffix),
+            metric.denominator.format(suffix=suffix))
+
+
+def can_compute(name, columns, age_group='0-10Y') -> bool:
+    """Есть ли в columns обе колонки-источника показателя"""
+    return all(col in columns for col in metric_sources(name, age_group))
+
+
+def compute_metric(name, data, age_group='0-10Y'):
+    """
+    Считает показатель векторно
+
+    Args:
+        name: Имя показателя из DERIVED_METRICS
+        data: DataFrame или словарь {колонка: массив или число}
+        age_group: Возрастная группа
+
+    Returns:
+        np.ndarray: Значения показателя (0-мерный массив для чисел)
+    """
+    metric = DERIVED_METRICS[name]
+    numerator, denominator = metric_sources(name, age_group)
+    num = np.asarray(data[numerator], dtype='float64')
+    den = np.asarray(data[denominator], dtype='float64')
+    out = np.full(np.broadcast(num, den).shape, metric.default,
+                  dtype='float64')
+    np.divide(num * metric.scale, den, out=out, where=den > 0)
+    if metric.decimals is not None:
+        out = np.round(out, metric.decimals)
+    return out
+
+
+def add_metrics(df, names, age_group='0-10Y', overwrite=True):
+    """
+    Добавляет показатели в DataFrame
+
+    Показатели без колонок-источников пропускаются. Исходный
+    DataFrame не изменяется.
+
+    Args:
+        df: DataFrame с колонками-источниками
+        names: Имена показателей
+        age_group: Возрастная группа
+        overwrite: Пересчитывать показатели, которые уже есть в df
+
+    Returns:
+        pd.DataFrame: df, если добавлять нечего, иначе новый DataFrame
+    """
+    values = {
+        name: compute_metric(name, df, age_group)
+        for name in names
+        if (overwrite or name not in df.columns)
+        and can_compute(name, df.columns, age_group)
+    }
+    return df.assign(**values) if values else df
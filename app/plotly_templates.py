@@ -3,15 +3,22 @@ plotly_templates.py — themed Plotly figures for the DNM RO dashboard.
 
 Single source of truth for chart styling, mirroring the CSS design
 system (assets/dashboard_theme.css) 1:1 in both dark and light themes.
-Pure Plotly + Dash compatible (no extra deps).
+Pure Plotly + Dash compatible (no extra deps). Figures are emitted
+as plain dicts in plotly's JSON form (see `figure`), skipping the
+per-build graph_objects validation. Theme-wide layout lives in the
+`dnm_dark` / `dnm_light` plotly templates registered at import; each
+figure carries only its own overrides.
 
 Theme tokens (THEMES, ACCENT_2, font stacks) live in constants.py.
 """
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.io as pio
 
 from .constants import ACCENT_2, FONT_STACK, MONO_STACK, THEMES
+from .metrics import add_metrics
 
 
 # ----------------------------------------------------------------------
@@ -62,9 +69,13 @@ def _fmt(kind, v):
     return f'{v:,.0f}'
 
 
-def base_layout(theme, **extra):
-    tok = THEMES[theme]
-    lay = dict(
+def _theme_layout(tok):
+    """Layout shared by every figure of a theme (goes into its template).
+
+    `yaxis` stays per figure: a template yaxis would also style the
+    secondary yaxis2.
+    """
+    return dict(
         paper_bgcolor=tok['paper'],
         plot_bgcolor=tok['plot'],
         font=dict(family=FONT_STACK, size=12, color=tok['font']),
@@ -81,6 +92,64 @@ def base_layout(theme, **extra):
             showgrid=False, zeroline=False, fixedrange=True,
             automargin=True, showline=False, tickangle=-45,
         ),
+    )
+
+
+# Parts of plotly's default template no dashboard figure uses (other
+# subplot kinds, colorscales, shape/annotation defaults)
+_UNUSED_TEMPLATE_LAYOUT = (
+    'annotationdefaults', 'coloraxis', 'colorscale', 'geo', 'mapbox',
+    'polar', 'scene', 'shapedefaults', 'ternary',
+)
+_TEMPLATE_TRACES = ('bar', 'scatter')
+
+
+def _register_theme_templates():
+    """Register `dnm_<theme>` plotly templates, once per process.
+
+    Each template is plotly's default template (what go.Figure applied
+    before) trimmed to bar/scatter and cartesian axes, with the theme
+    layout on top.
+    """
+    default = pio.templates[pio.templates.default]
+    for theme, tok in THEMES.items():
+        template = go.layout.Template(
+            layout=default.layout,
+            data={kind: default.data[kind] for kind in _TEMPLATE_TRACES},
+        )
+        for key in _UNUSED_TEMPLATE_LAYOUT:
+            template.layout[key] = None
+        template.layout.update(_theme_layout(tok))
+        pio.templates[f'dnm_{theme}'] = template
+    return {
+        theme: pio.templates[f'dnm_{theme}'].to_plotly_json()
+        for theme in THEMES
+    }
+
+
+# JSON of the registered templates. plotly.js has no named-template
+# registry, so a template name alone would be ignored in the browser:
+# each figure embeds the (compact, shared) template of its theme.
+THEME_TEMPLATES = _register_theme_templates()
+
+
+def figure(traces, layout, theme='dark'):
+    """Figure as a plain dict: the JSON go.Figure would produce.
+
+    Skips graph_objects construction and property validation; dcc.Graph
+    and plotly.io accept the dict directly. Traces carry an explicit
+    `type`; `layout` holds only the figure-specific overrides of the
+    theme template `dnm_<theme>`.
+    """
+    return {
+        'data': traces,
+        'layout': dict(layout, template=THEME_TEMPLATES[theme]),
+    }
+
+
+def base_layout(theme, **extra):
+    """Figure-specific layout on top of the `dnm_<theme>` template."""
+    lay = dict(
         yaxis=dict(
             visible=False, showgrid=False, zeroline=False,
             fixedrange=True,
@@ -90,22 +159,125 @@ def base_layout(theme, **extra):
     return lay
 
 
+# ----------------------------------------------------------------------
+# DATA PREPARATION
+# ----------------------------------------------------------------------
+TOP_MODELS = 10
+
+
+def _without_total(df):
+    return df[df['model'] != 'TOTAL'] if 'model' in df.columns else df
+
+
+def top_positions(values, top=TOP_MODELS):
+    """Positions of the `top` largest values, largest first.
+
+    Finds the `top`-th largest value by partial selection
+    (np.partition) and sorts only the selected positions, so the cost
+    is linear in len(values) for any `top`. NaN ranks last; ties keep
+    their original order, as with a stable sort.
+    """
+    keys = np.asarray(values, dtype='float64')
+    keys = np.where(np.isnan(keys), -np.inf, keys)
+    top = min(top, len(keys))
+    if top <= 0:
+        return np.arange(0)
+    if top < len(keys):
+        cutoff = -np.partition(-keys, top - 1)[top - 1]
+        above = np.flatnonzero(keys > cutoff)
+        ties = np.flatnonzero(keys == cutoff)[:top - len(above)]
+        picked = np.concatenate([above, ties])
+    else:
+        picked = np.arange(len(keys))
+    return picked[np.lexsort((picked, -keys[picked]))]
+
+
+def _top_slice(data, sort_key, top):
+    if sort_key not in data.columns:
+        return data.head(top)
+    return data.iloc[top_positions(data[sort_key].to_numpy(), top)]
+
+
+def top_models(df, sort_key, top=TOP_MODELS):
+    """Top `top` models by `sort_key` (descending), TOTAL row excluded.
+
+    If `sort_key` is missing the first `top` rows are returned as is.
+    """
+    return _top_slice(_without_total(df), sort_key, top)
+
+
+def age_sort_column(df, age_group='0-10Y'):
+    """Column the age-groups figure is ranked by."""
+    total_col = 'total_0_5' if age_group == '0-5Y' else 'total_0_10'
+    return total_col if total_col in df.columns else 'age_0_3'
+
+
+def add_ratio_column(df, age_group='0-10Y'):
+    """Derive the 0-5Y RO ratio against AVG UIO if it is missing.
+
+    Uses the shared metric definition (metrics.DERIVED_METRICS).
+    Returns `df` itself when there is nothing to add, otherwise a new
+    frame (the input is never modified).
+    """
+    if age_group != '0-5Y' or df is None:
+        return df
+    return add_metrics(df, ['ro_ratio_of_avg_uio_5y'], age_group,
+                       overwrite=False)
+
+
+def chart_columns(df, age_group='0-10Y'):
+    """Ranking column of each figure (keys as in build_dashboard_figures).
+
+    `df` must already carry the derived ratio (see add_ratio_column).
+    """
+    if age_group == '0-5Y':
+        lh_col = 'labor_hours_0_5'
+        ratio_col = 'ro_ratio_of_avg_uio_5y'
+        if ratio_col not in df.columns:
+            ratio_col = 'ro_ratio_of_uio_5y'
+    else:
+        lh_col = 'labor_hours_0_10'
+        ratio_col = 'ro_ratio_of_uio_10y'
+    return {
+        'fig_profit': 'total_ro_cost',
+        'fig_mh': lh_col,
+        'fig_avg_mh': 'aver_labor_hours_per_vhc',
+        'fig_avg_check': 'avg_ro_cost',
+        'fig_ratio': ratio_col,
+        'fig_ro_years': age_sort_column(df, age_group),
+    }
+
+
+def rank_models(df, age_group='0-10Y', top=TOP_MODELS):
+    """Top-model slices of `df` keyed by ranking column.
+
+    The TOTAL row is dropped once and every ranking column of the six
+    figures is selected from the same rows (see top_positions).
+    """
+    data = _without_total(df)
+    return {
+        col: _top_slice(data, col, top)
+        for col in dict.fromkeys(chart_columns(df, age_group).values())
+    }
+
+
 # ----------------------------------------------------------------------
 # CHART BUILDERS
 # ----------------------------------------------------------------------
-def ranked_bar(df, value_key, value_fmt='abbr', top=10, theme='dark',
+def ranked_bar(df, value_key, value_fmt='abbr', top=TOP_MODELS,
+               theme='dark',
                currency=None, region_df=None, region_key=None,
                region_label='Region Average'):
     """Vertical ranked bar with opacity ramp and labels above bars.
 
     Optionally overlays a Region Average scatter on a secondary axis.
     `df` is a pandas DataFrame; `value_key`/`region_key` are columns.
+    Pass top=None when `df` is already a ranked slice (rank_models).
     """
     tok = THEMES[theme]
     region_key = region_key or value_key
 
-    data = df[df['model'] != 'TOTAL'] if 'model' in df.columns else df
-    data = data.sort_values(value_key, ascending=False).head(top)
+    data = df if top is None else top_models(df, value_key, top)
 
     x = data['model'].tolist()
     y = data[value_key].tolist()
@@ -118,8 +290,8 @@ def ranked_bar(df, value_key, value_fmt='abbr', top=10, theme='dark',
     else:
         hover = [f'{v:,.0f}' if pd.notna(v) else '' for v in y]
 
-    fig = go.Figure(go.Bar(
-        x=x, y=y,
+    traces = [dict(
+        type='bar', x=x, y=y,
         marker=dict(
             color=ramp(tok['accent'], len(y)),
             cornerradius=5, line=dict(width=0),
@@ -128,7 +300,7 @@ def ranked_bar(df, value_key, value_fmt='abbr', top=10, theme='dark',
         textfont=dict(family=MONO_STACK, size=10.5, color=tok['font']),
         customdata=hover,
         hovertemplate='<b>%{x}</b><br>%{customdata}<extra></extra>',
-    ))
+    )]
 
     lay = base_layout(theme)
     valid_y = [v for v in y if pd.notna(v)] or [1]
@@ -143,8 +315,8 @@ def ranked_bar(df, value_key, value_fmt='abbr', top=10, theme='dark',
                 '<b>%{x}</b><br>%{y:,.0f} · '
                 + region_label + '<extra></extra>'
             )
-            fig.add_trace(go.Scatter(
-                x=reg['model'].tolist(),
+            traces.append(dict(
+                type='scatter', x=reg['model'].tolist(),
                 y=reg[region_key].tolist(),
                 mode='markers', name=region_label, yaxis='y2',
                 marker=dict(
@@ -166,24 +338,20 @@ def ranked_bar(df, value_key, value_fmt='abbr', top=10, theme='dark',
                 tickformat='~s',
             )
 
-    fig.update_layout(lay)
-    return fig
+    return figure(traces, lay, theme)
 
 
-def age_groups(df, age_group='0-10Y', theme='dark'):
+def age_groups(df, age_group='0-10Y', theme='dark', top=TOP_MODELS):
     """Stacked RO by age band (0-3y / 4-5y [/ 6-10y]) + AVG UIO
-    spline on a secondary axis."""
+    spline on a secondary axis. Pass top=None when `df` is already
+    a ranked slice (rank_models)."""
     tok = THEMES[theme]
     r, g, b = _hex2rgb(tok['accent'])
 
-    total_col = 'total_0_5' if age_group == '0-5Y' else 'total_0_10'
     avg_uio_col = 'avg_uio_5y' if age_group == '0-5Y' else 'avg_uio_10y'
 
-    data = df[df['model'] != 'TOTAL'] if 'model' in df.columns else df
-    sort_col = total_col if total_col in data.columns else 'age_0_3'
-    if sort_col in data.columns:
-        data = data.sort_values(sort_col, ascending=False)
-    data = data.head(10)
+    data = (df if top is None
+            else top_models(df, age_sort_column(df, age_group), top))
     order = data['model'].tolist()
 
     bands = [
@@ -199,8 +367,8 @@ def age_groups(df, age_group='0-10Y', theme='dark'):
             continue
         vals = data[col].tolist()
         hov = '%{x} · ' + name + '<br>%{y:,} RO<extra></extra>'
-        traces.append(go.Bar(
-            name=name, x=order, y=vals,
+        traces.append(dict(
+            type='bar', name=name, x=order, y=vals,
             marker=dict(
                 color=f'rgba({r},{g},{b},{alpha})', cornerradius=3,
             ),
@@ -214,8 +382,9 @@ def age_groups(df, age_group='0-10Y', theme='dark'):
     if avg_uio_col in data.columns:
         r2, g2, b2 = _hex2rgb(ACCENT_2)
         uio_color = f'rgba({r2},{g2},{b2},0.5)'
-        traces.append(go.Scatter(
-            name='AVG UIO', x=order, y=data[avg_uio_col].tolist(),
+        traces.append(dict(
+            type='scatter', name='AVG UIO', x=order,
+            y=data[avg_uio_col].tolist(),
             mode='lines+markers', yaxis='y2',
             line=dict(color=uio_color, width=1.5, shape='spline'),
             marker=dict(size=5, color=uio_color),
@@ -242,75 +411,42 @@ def age_groups(df, age_group='0-10Y', theme='dark'):
             tickformat='~s',
         ),
     )
-    fig = go.Figure(traces)
-    fig.update_layout(lay)
-    return fig
+    return figure(traces, lay, theme)
 
 
 # ----------------------------------------------------------------------
 # DISPATCHER  — returns the 6 figures the layout expects
 # ----------------------------------------------------------------------
 def build_dashboard_figures(df, age_group='0-10Y', region_df=None,
-                            theme='dark'):
+                            theme='dark', ranked=None, top=TOP_MODELS):
     """Build all six themed figures from a processed DataFrame.
 
+    `ranked` optionally maps ranking columns to precomputed top-model
+    slices (see rank_models); when given, `df` and `region_df` must
+    already carry the derived ratio column and `top` is ignored.
+
     Returns a dict with the keys consumed by create_charts_container:
     fig_profit, fig_mh, fig_avg_mh, fig_avg_check, fig_ratio,
     fig_ro_years.
     """
-    if age_group == '0-5Y':
-        lh_col = 'labor_hours_0_5'
-        ratio_col = 'ro_ratio_of_avg_uio_5y'
-    else:
-        lh_col = 'labor_hours_0_10'
-        ratio_col = 'ro_ratio_of_uio_10y'
-
-    df = df.copy()
-
-    # Derive the 0-5Y ratio against AVG UIO if not present
-    if age_group == '0-5Y' and ratio_col not in df.columns:
-        if 'avg_uio_5y' in df.columns and 'total_0_5' in df.columns:
-            df[ratio_col] = df.apply(
-                lambda row: (
-                    round(100 * row['total_0_5'] / row['avg_uio_5y'], 2)
-                    if row['avg_uio_5y'] > 0 else 0
-                ),
-                axis=1,
-            )
-        else:
-            ratio_col = 'ro_ratio_of_uio_5y'
+    if ranked is None:
+        df = add_ratio_column(df, age_group)
+        region_df = add_ratio_column(region_df, age_group)
+        ranked = rank_models(df, age_group, top)
+    cols = chart_columns(df, age_group)
 
-    if (region_df is not None and not region_df.empty
-            and age_group == '0-5Y'
-            and ratio_col == 'ro_ratio_of_avg_uio_5y'
-            and ratio_col not in region_df.columns
-            and 'avg_uio_5y' in region_df.columns
-            and 'total_0_5' in region_df.columns):
-        region_df = region_df.copy()
-        region_df[ratio_col] = region_df.apply(
-            lambda row: (
-                round(100 * row['total_0_5'] / row['avg_uio_5y'], 2)
-                if row['avg_uio_5y'] > 0 else 0
-            ),
-            axis=1,
-        )
+    def bar(key, value_fmt, currency=None):
+        return ranked_bar(
+            ranked[cols[key]], cols[key], value_fmt=value_fmt, top=None,
+            theme=theme, currency=currency, region_df=region_df)
 
     return {
-        'fig_profit': ranked_bar(
-            df, 'total_ro_cost', value_fmt='abbr', theme=theme,
-            currency='RUB', region_df=region_df),
-        'fig_mh': ranked_bar(
-            df, lh_col, value_fmt='abbr', theme=theme,
-            region_df=region_df),
-        'fig_avg_mh': ranked_bar(
-            df, 'aver_labor_hours_per_vhc', value_fmt='float1',
-            theme=theme, region_df=region_df),
-        'fig_avg_check': ranked_bar(
-            df, 'avg_ro_cost', value_fmt='abbr', theme=theme,
-            currency='RUB', region_df=region_df),
-        'fig_ratio': ranked_bar(
-            df, ratio_col, value_fmt='pct1', theme=theme,
-            region_df=region_df),
+        'fig_profit': bar('fig_profit', 'abbr', currency='RUB'),
+        'fig_mh': bar('fig_mh', 'abbr'),
+        'fig_avg_mh': bar('fig_avg_mh', 'float1'),
+        'fig_avg_check': bar('fig_avg_check', 'abbr', currency='RUB'),
+        'fig_ratio': bar('fig_ratio', 'pct1'),
         'fig_ro_years': age_groups(
-            df, age_group=age_group, theme=theme),
+            ranked[cols['fig_ro_years']], age_group=age_group,
+            theme=theme, top=None),
     }
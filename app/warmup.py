@@ -0,0 +1,161 @@
+"""
+Прогрев кеша данных дашборда
+
+При запуске и затем по расписанию в фоновом потоке загружаются
+самые частые представления: для каждого года и возрастной группы —
+вид без фильтров, каждый выбранный регион и каждый выбранный холдинг.
+Прогревается готовое представление (get_dashboard_view): данные,
+метрики, топ-срезы и строки таблицы. Сервер принимает запросы сразу,
+прогрев идет параллельно.
+"""
+import threading
+import time
+
+from loguru import logger
+
+from config import settings
+from database.dealers import dealer_directory
+from .functions import (
+    get_available_years,
+    get_current_year,
+    get_dashboard_view
+)
+
+
+def _split(value: str) -> list:
+    """Разбивает строку настройки через запятую"""
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def _resolve_years(value: str) -> list:
+    """Годы прогрева: current, all или список через запятую"""
+    if value == 'current':
+        return [get_current_year()]
+    if value == 'all':
+        return get_available_years()
+    return [int(year) for year in _split(value)]
+
+
+def _resolve(value: str, all_values) -> list:
+    """Регионы / холдинги прогрева: * — все, иначе список"""
+    if value == '*':
+        return list(all_values())
+    return [item for item in _split(value) if item != 'All']
+
+
+def warmup_views() -> list:
+    """
+    Список представлений для прогрева
+
+    Returns:
+        list: Кортежи (год, возрастная группа, holding, region)
+    """
+    warmup = settings.warmup
+    regions = _resolve(warmup.regions, dealer_directory.regions)
+    holdings = _resolve(warmup.holdings, dealer_directory.holdings)
+
+    views = []
+    for year in _resolve_years(warmup.years):
+        for age_group in _split(warmup.age_groups):
+            views.append((year, age_group, 'All', 'All'))
+            views.extend(
+                (year, age_group, 'All', region) for region in regions
+            )
+            views.extend(
+                (year, age_group, holding, 'All') for holding in holdings
+            )
+    return views
+
+
+class CacheWarmer:
+    """Фоновый прогрев кеша при запуске и по расписанию"""
+
+    def __init__(self, interval: int = 3600):
+        """
+        Args:
+            interval: Период повторного прогрева, сек (0 — только при
+                      запуске)
+        """
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.last_run = None
+
+    def start(self):
+        """Запускает прогрев в фоновом потоке (не блокирует сервер)"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._loop, name='cache-warmup', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает повторный прогрев"""
+        self._stop_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f'Ошибка прогрева кеша: {e}')
+            if self.interval <= 0:
+                return
+            self._stop_event.wait(self.interval)
+
+    def run_once(self) -> dict:
+        """
+        Прогревает все представления по очереди
+
+        Returns:
+            dict: Количество прогретых и неудачных представлений
+        """
+        views = warmup_views()
+        started = time.perf_counter()
+        done = failed = 0
+        logger.info(f'Прогрев кеша: {len(views)} представлений')
+
+        for number, view in enumerate(views, start=1):
+            if self._stop_event.is_set():
+                break
+            year, age_group, holding, region = view
+            view_started = time.perf_counter()
+            try:
+                get_dashboard_view(year, age_group, 'All', holding, region)
+                done += 1
+            except Exception as e:
+                failed += 1
+                logger.warning(f'Прогрев кеша: ошибка для {view}: {e}')
+                continue
+            logger.info(
+                f'Прогрев кеша {number}/{len(views)}: год={year}, '
+                f'группа={age_group}, холдинг={holding}, регион={region} '
+                f'({time.perf_counter() - view_started:.2f} с)'
+            )
+
+        self.runs += 1
+        self.last_run = {
+            'views': len(views),
+            'done': done,
+            'failed': failed,
+            'seconds': round(time.perf_counter() - started, 2),
+        }
+        logger.success(
+            f'Прогрев кеша завершен: {done}/{len(views)} за '
+            f'{self.last_run["seconds"]} с'
+        )
+        return self.last_run
+
+    def stats(self) -> dict:
+        """Статистика прогрева"""
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'last_run': self.last_run,
+        }
+
+
+# Глобальный прогрев для использования в приложении
+cache_warmer = CacheWarmer(interval=settings.warmup.interval)
@@ -25,6 +25,61 @@ class DatabaseSettings(BaseSettings):
         default='',
         description='Пароль базы данных'
         )
+    pool_size: int = Field(
+        default=5,
+        description='Число постоянных соединений в пуле'
+    )
+    pool_max_overflow: int = Field(
+        default=10,
+        description='Сколько соединений можно открыть сверх pool_size'
+    )
+    pool_recycle: int = Field(
+        default=1800,
+        description='Время жизни соединения в секундах (-1 — без ограничения)'
+    )
+    pool_pre_ping: bool = Field(
+        default=True,
+        description='Проверять соединение перед выдачей из пула'
+    )
+    pool_timeout: int = Field(
+        default=30,
+        description='Сколько секунд ждать свободное соединение из пула'
+    )
+    pool_warmup: int = Field(
+        default=2,
+        description='Сколько соединений открыть заранее при создании пула'
+    )
+    chunk_size: int = Field(
+        default=10000,
+        description='Размер порции строк при потоковом чтении запроса'
+    )
+    fetch_mode: str = Field(
+        default='rows',
+        description='Способ чтения результата: rows (DBAPI) или copy (COPY)'
+    )
+    prepared_statements: bool = Field(
+        default=True,
+        description='Выполнять DNM-запросы как prepared statements'
+    )
+    dealers_refresh_interval: int = Field(
+        default=3600,
+        description='Период обновления справочника дилеров, сек (0 — нет)'
+    )
+    watermark_query: str = Field(
+        default='',
+        description=(
+            'Запрос watermark данных: колонки year, watermark и '
+            '(необязательно) mobis_code; пусто — не опрашивать'
+        )
+    )
+    watermark_interval: int = Field(
+        default=60,
+        description='Период опроса watermark данных, сек'
+    )
+    notify_channel: str = Field(
+        default='',
+        description='Канал LISTEN/NOTIFY об изменении данных (пусто — нет)'
+    )
 
     model_config = SettingsConfigDict(
         env_prefix='DB_',
@@ -44,6 +99,17 @@ class DatabaseSettings(BaseSettings):
             'password': self.password,
         }
 
+    @property
+    def pool_params(self) -> dict:
+        """Возвращает параметры пула соединений для SQLAlchemy"""
+        return {
+            'pool_size': self.pool_size,
+            'max_overflow': self.pool_max_overflow,
+            'pool_recycle': self.pool_recycle,
+            'pool_pre_ping': self.pool_pre_ping,
+            'pool_timeout': self.pool_timeout,
+        }
+
     @property
     def sqlalchemy_url(self) -> str:
         """Возвращает URL для подключения через SQLAlchemy"""
@@ -66,8 +132,129 @@ class AppSettings(BaseSettings):
         default=8050,
         description='Порт приложения'
         )
+    data_workers: int = Field(
+        default=4,
+        description='Потоки для параллельной загрузки данных дашборда'
+    )
+    data_grain: str = Field(
+        default='model',
+        description=(
+            'Гранулярность загрузки DNM: model — запрос на каждый набор '
+            'фильтров, dealer — один запрос дилер × модель на год и '
+            'возрастную группу с агрегацией в памяти'
+        )
+    )
+
+    top_models: int = Field(
+        default=10,
+        description='Число моделей на ранжированных графиках (топ-N)'
+    )
+
+    region_cross_check: bool = Field(
+        default=False,
+        description=(
+            'Сверять средние региона, посчитанные в памяти, с запросом '
+            '*_by_region (отладка)'
+        )
+    )
+
+    model_config = SettingsConfigDict(
+        env_file='.env',
+        env_file_encoding='utf-8',
+        case_sensitive=False,
+        extra='ignore'
+    )
+
+
+class CacheSettings(BaseSettings):
+    """Настройки кеша данных дашборда"""
+
+    max_bytes: int = Field(
+        default=256 * 1024 * 1024,
+        description='Бюджет памяти кеша данных в байтах'
+    )
+    current_year_ttl: int = Field(
+        default=300,
+        description='Время жизни данных текущего года в кеше, сек'
+    )
+    stale_while_revalidate: bool = Field(
+        default=True,
+        description='Отдавать истекшие данные сразу и обновлять их в фоне'
+    )
+    persist_dir: str = Field(
+        default='',
+        description='Каталог общего для воркеров кеша на диске '
+                    '(пусто — только кеш в памяти)'
+    )
+
+    model_config = SettingsConfigDict(
+        env_prefix='CACHE_',
+        env_file='.env',
+        env_file_encoding='utf-8',
+        case_sensitive=False,
+        extra='ignore'
+    )
+
+
+class WarmupSettings(BaseSettings):
+    """Настройки прогрева кеша данных"""
+
+    enabled: bool = Field(
+        default=True,
+        description='Прогревать кеш при запуске и по расписанию'
+    )
+    interval: int = Field(
+        default=3600,
+        description='Период повторного прогрева, сек (0 — только при запуске)'
+    )
+    years: str = Field(
+        default='current',
+        description='Годы: current, all или список через запятую'
+    )
+    age_groups: str = Field(
+        default='0-10Y,0-5Y',
+        description='Возрастные группы через запятую'
+    )
+    regions: str = Field(
+        default='*',
+        description='Регионы через запятую (* — все регионы)'
+    )
+    holdings: str = Field(
+        default='',
+        description='Холдинги через запятую (* — все холдинги)'
+    )
+
+    model_config = SettingsConfigDict(
+        env_prefix='WARMUP_',
+        env_file='.env',
+        env_file_encoding='utf-8',
+        case_sensitive=False,
+        extra='ignore'
+    )
+
+
+class SnapshotSettings(BaseSettings):
+    """Настройки снимков данных на диске"""
+
+    dir: str = Field(
+        default='',
+        description='Каталог снимков Arrow IPC (пусто — снимки отключены)'
+    )
+    interval: int = Field(
+        default=86400,
+        description='Период обновления снимков, сек (0 — только при запуске)'
+    )
+    years: int = Field(
+        default=6,
+        description='Сколько последних лет (включая текущий) снимать'
+    )
+    offline: bool = Field(
+        default=False,
+        description='Офлайн-режим: данные читаются только из снимков'
+    )
 
     model_config = SettingsConfigDict(
+        env_prefix='SNAPSHOT_',
         env_file='.env',
         env_file_encoding='utf-8',
         case_sensitive=False,
@@ -80,6 +267,9 @@ class Settings(BaseSettings):
 
     database: DatabaseSettings = Field(default_factory=DatabaseSettings)
     app: AppSettings = Field(default_factory=AppSettings)
+    cache: CacheSettings = Field(default_factory=CacheSettings)
+    warmup: WarmupSettings = Field(default_factory=WarmupSettings)
+    snapshot: SnapshotSettings = Field(default_factory=SnapshotSettings)
 
     model_config = SettingsConfigDict(
         env_file='.env',
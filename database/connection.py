@@ -1,5 +1,9 @@
 from contextlib import contextmanager
+import os
+import threading
 import time
+from typing import Iterator
+from uuid import uuid4
 
 import pandas as pd
 import psycopg2
@@ -8,6 +12,14 @@ from sqlalchemy.engine import Engine
 from loguru import logger
 
 from config import settings
+from database.schema import CATEGORY_COLUMNS, TEXT_COLUMNS
+
+
+FETCH_MODES = ('rows', 'copy')
+
+
+class PrepareError(Exception):
+    """Запрос не удалось подготовить (PREPARE) на стороне БД"""
 
 
 class DatabaseConnection:
@@ -16,21 +28,86 @@ class DatabaseConnection:
     def __init__(self):
         self.config = settings.database.connection_params
         self.sqlalchemy_url = settings.database.sqlalchemy_url
+        self.pool_params = settings.database.pool_params
+        self.pool_warmup = settings.database.pool_warmup
+        self.chunk_size = settings.database.chunk_size
+        self.fetch_mode = settings.database.fetch_mode
         self._engine: Engine = None
+        self._engine_lock = threading.Lock()
 
     @property
     def engine(self) -> Engine:
-        """Возвращает SQLAlchemy engine (создается при первом обращении)"""
+        """
+        Возвращает SQLAlchemy engine с общим пулом соединений
+
+        Engine создается при первом обращении; через его пул работают и
+        execute_query, и get_connection.
+        """
         if self._engine is None:
-            self._engine = create_engine(self.sqlalchemy_url)
+            with self._engine_lock:
+                if self._engine is None:
+                    engine = create_engine(
+                        self.sqlalchemy_url, **self.pool_params
+                    )
+                    self._warm_up(engine)
+                    self._engine = engine
         return self._engine
 
+    def _warm_up(self, engine: Engine):
+        """Заранее открывает pool_warmup соединений и возвращает их в пул"""
+        count = min(self.pool_warmup, self.pool_params['pool_size'])
+        if count <= 0:
+            return
+
+        connections = []
+        try:
+            for _ in range(count):
+                connections.append(engine.raw_connection())
+            logger.info(f'Пул соединений прогрет: {count} соединений')
+        except Exception as e:
+            logger.warning(f'Не удалось прогреть пул соединений: {e}')
+        finally:
+            for conn in connections:
+                conn.close()
+
+    def pool_stats(self) -> dict:
+        """
+        Возвращает текущую статистику пула соединений
+
+        Returns:
+            dict: Размер пула, занятые и свободные соединения, overflow
+        """
+        if self._engine is None:
+            return {
+                'initialized': False,
+                'size': self.pool_params['pool_size'],
+                'max_overflow': self.pool_params['max_overflow'],
+                'checked_in': 0,
+                'checked_out': 0,
+                'overflow': 0,
+            }
+
+        pool = self._engine.pool
+        return {
+            'initialized': True,
+            'size': pool.size(),
+            'max_overflow': self.pool_params['max_overflow'],
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+        }
+
     @contextmanager
     def get_connection(self):
-        """Контекстный менеджер для подключения к базе данных"""
+        """
+        Контекстный менеджер для подключения к базе данных
+
+        Соединение берется из общего пула engine и возвращается в него
+        при выходе из контекста.
+        """
         conn = None
         try:
-            conn = psycopg2.connect(**self.config)
+            conn = self.engine.raw_connection()
             yield conn
         except psycopg2.Error as e:
             if conn:
@@ -40,29 +117,47 @@ class DatabaseConnection:
             if conn:
                 conn.close()
 
-    def execute_query(self, query: str, params: dict = None) -> pd.DataFrame:
+    def execute_query(self, query: str, params: dict = None,
+                      fetch_mode: str = None) -> pd.DataFrame:
         """
         Выполняет SQL запрос и возвращает результат в виде DataFrame
 
         Args:
             query (str): SQL запрос
             params (dict): Параметры для запроса
+            fetch_mode (str): Способ чтения результата: 'rows' — через
+                              DBAPI и pd.read_sql_query, 'copy' — через
+                              COPY ... TO STDOUT (CSV). По умолчанию
+                              settings.database.fetch_mode.
 
         Returns:
             pd.DataFrame: Результат запроса
         """
+        fetch_mode = fetch_mode or self.fetch_mode
+        if fetch_mode not in FETCH_MODES:
+            raise ValueError(
+                f'Неизвестный режим чтения {fetch_mode!r}, '
+                f'ожидается один из {FETCH_MODES}'
+            )
+
         start_time = time.time()
 
         # Логируем начало выполнения запроса
         query_preview = query[:100] + '...' if len(query) > 100 else query
-        logger.info(f'Начинаем выполнение SQL запроса: {query_preview}')
+        logger.info(
+            f'Начинаем выполнение SQL запроса ({fetch_mode}): '
+            f'{query_preview}'
+        )
 
         if params:
             logger.debug(f'Параметры запроса: {params}')
 
         try:
-            # Используем SQLAlchemy engine для pandas
-            df = pd.read_sql_query(query, self.engine, params=params)
+            if fetch_mode == 'copy':
+                df = self._fetch_copy(query, params)
+            else:
+                # Используем SQLAlchemy engine для pandas
+                df = pd.read_sql_query(query, self.engine, params=params)
 
             execution_time = time.time() - start_time
             logger.success(
@@ -78,6 +173,210 @@ class DatabaseConnection:
             )
             raise e
 
+    def execute_prepared(self, name: str, query: str,
+                         values: list = None) -> pd.DataFrame:
+        """
+        Выполняет запрос как prepared statement и возвращает DataFrame
+
+        Statement готовится (PREPARE) один раз на каждое соединение пула;
+        подготовленные имена хранятся в conn.info и сбрасываются вместе
+        с соединением. PREPARE не откатывается вместе с транзакцией,
+        поэтому имя запоминается только после успешной подготовки.
+        Ошибка самой подготовки (например, запрос из нескольких
+        команд или без параметров нужного типа) поднимается как
+        PrepareError, чтобы вызывающий код мог выполнить запрос
+        обычным способом.
+
+        Args:
+            name (str): Имя prepared statement
+            query (str): SQL с позиционными параметрами $1, $2, ...
+            values (list): Значения параметров по порядку
+
+        Returns:
+            pd.DataFrame: Результат запроса
+        """
+        values = list(values or [])
+        start_time = time.time()
+        logger.info(f'Начинаем выполнение SQL запроса (prepared): {name}')
+        if values:
+            logger.debug(f'Параметры запроса: {values}')
+
+        try:
+            with self.get_connection() as conn:
+                prepared = conn.info.setdefault('prepared_statements', set())
+                cursor = conn.cursor()
+                try:
+                    if name not in prepared:
+                        try:
+                            cursor.execute(f'PREPARE {name} AS {query}')
+                        except psycopg2.Error as e:
+                            conn.rollback()
+                            raise PrepareError(
+                                f'PREPARE {name} не выполнен: {e}'
+                            ) from e
+                        prepared.add(name)
+                    if values:
+                        placeholders = ', '.join(['%s'] * len(values))
+                        cursor.execute(
+                            f'EXECUTE {name} ({placeholders})', values
+                        )
+                    else:
+                        cursor.execute(f'EXECUTE {name}')
+                    columns = [col[0] for col in cursor.description]
+                    rows = cursor.fetchall()
+                finally:
+                    cursor.close()
+                conn.rollback()
+
+            df = pd.DataFrame.from_records(rows, columns=columns)
+            execution_time = time.time() - start_time
+            logger.success(
+                f'Запрос выполнен успешно за {execution_time:.3f}с, '
+                f'получено {len(df)} строк'
+            )
+            return df
+        except Exception as e:
+            execution_time = time.time() - start_time
+            logger.error(
+                f'Ошибка при выполнении запроса за {execution_time:.3f}с: {e}'
+            )
+            raise e
+
+    def _fetch_copy(self, query: str, params: dict = None) -> pd.DataFrame:
+        """
+        Читает результат запроса через COPY (...) TO STDOUT в формате CSV
+
+        Поток COPY разбирается C-парсером pandas сразу в типизированные
+        колонки, без создания Python-объекта на каждую строку и без
+        промежуточного буфера со всем CSV (см. _read_copy).
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                # COPY не поддерживает параметры — подставляем их заранее
+                inner = cursor.mogrify(query.strip().rstrip(';'), params)
+                copy_sql = (
+                    f'COPY ({inner.decode("utf-8")}) TO STDOUT '
+                    f"WITH (FORMAT csv, HEADER true, NULL '\\N')"
+                )
+                df = self._read_copy(cursor, copy_sql)
+            finally:
+                cursor.close()
+            conn.rollback()
+        return df
+
+    @staticmethod
+    def _read_copy(cursor, copy_sql: str) -> pd.DataFrame:
+        """
+        Разбирает вывод COPY по мере поступления
+
+        COPY пишет в pipe в отдельном потоке, read_csv читает из него,
+        поэтому в памяти одновременно только буфер pipe и готовые
+        колонки. NULL передается как \\N: пустые строки в текстовых
+        колонках (database.schema) остаются пустыми строками, а не NaN;
+        текстовые колонки читаются как строки без угадывания типа.
+        """
+        read_fd, write_fd = os.pipe()
+        errors = []
+
+        def copy():
+            with os.fdopen(write_fd, 'wb') as writer:
+                try:
+                    cursor.copy_expert(copy_sql, writer)
+                except Exception as e:
+                    errors.append(e)
+
+        writer_thread = threading.Thread(
+            target=copy, name='dnm-copy', daemon=True
+        )
+        writer_thread.start()
+        try:
+            # Закрытие pipe при ошибке разбора прерывает и COPY
+            with os.fdopen(read_fd, 'rb') as reader:
+                try:
+                    df = pd.read_csv(
+                        reader,
+                        dtype={
+                            col: str
+                            for col in TEXT_COLUMNS + CATEGORY_COLUMNS
+                        },
+                        keep_default_na=False,
+                        na_values=['\\N'],
+                    )
+                except pd.errors.EmptyDataError:
+                    df = pd.DataFrame()
+        finally:
+            writer_thread.join()
+        if errors:
+            raise errors[0]
+        return df
+
+    def iter_query(self, query: str, params: dict = None,
+                   chunksize: int = None) -> Iterator[pd.DataFrame]:
+        """
+        Выполняет SQL запрос через server-side cursor и отдает результат
+        порциями, не держа весь результат в памяти клиента
+
+        Args:
+            query (str): SQL запрос
+            params (dict): Параметры для запроса
+            chunksize (int): Размер порции строк (по умолчанию
+                             settings.database.chunk_size)
+
+        Yields:
+            pd.DataFrame: Очередная порция результата. Для пустого
+                          результата отдается один пустой DataFrame
+                          с колонками запроса.
+        """
+        chunksize = chunksize or self.chunk_size
+        start_time = time.time()
+
+        query_preview = query[:100] + '...' if len(query) > 100 else query
+        logger.info(
+            f'Начинаем потоковое выполнение SQL запроса '
+            f'(порции по {chunksize}): {query_preview}'
+        )
+
+        if params:
+            logger.debug(f'Параметры запроса: {params}')
+
+        total_rows = 0
+        chunks = 0
+        try:
+            with self.get_connection() as conn:
+                # Именованный курсор живет на сервере внутри транзакции
+                cursor = conn.cursor(name=f'dnm_stream_{uuid4().hex}')
+                cursor.itersize = chunksize
+                try:
+                    cursor.execute(query, params)
+                    while True:
+                        rows = cursor.fetchmany(chunksize)
+                        columns = [col[0] for col in cursor.description]
+                        if not rows and chunks:
+                            break
+                        chunks += 1
+                        total_rows += len(rows)
+                        yield pd.DataFrame.from_records(
+                            rows, columns=columns
+                        )
+                        if not rows:
+                            break
+                finally:
+                    cursor.close()
+
+            execution_time = time.time() - start_time
+            logger.success(
+                f'Потоковый запрос выполнен за {execution_time:.3f}с, '
+                f'получено {total_rows} строк в {chunks} порциях'
+            )
+        except Exception as e:
+            execution_time = time.time() - start_time
+            logger.error(
+                f'Ошибка при потоковом выполнении запроса '
+                f'за {execution_time:.3f}с: {e}'
+            )
+            raise e
+
     def test_connection(self) -> bool:
         """
         Проверяет подключение к базе данных
@@ -0,0 +1,192 @@
+"""
+Справочник дилеров в памяти
+
+Таблица public.dealers_data загружается один раз, по ней строятся
+хеш-индексы по mobis_code, region и holding. Все поиски — чтение из
+словаря без обращения к БД. Справочник периодически перечитывается
+в фоновом потоке.
+"""
+import threading
+from collections import namedtuple
+
+import pandas as pd
+from loguru import logger
+
+from config import settings
+from database.connection import db_connection
+
+
+DEALERS_QUERY = """
+SELECT mobis_code, dealer_name, holding, region
+FROM public.dealers_data
+WHERE mobis_code IS NOT NULL
+ORDER BY mobis_code
+"""
+
+_DirectoryState = namedtuple(
+    '_DirectoryState',
+    ['dealers', 'by_mobis_code', 'by_region', 'by_holding', 'regions']
+)
+
+_EMPTY_STATE = _DirectoryState(
+    dealers=pd.DataFrame(
+        columns=['mobis_code', 'dealer_name', 'holding', 'region']
+    ),
+    by_mobis_code={},
+    by_region={},
+    by_holding={},
+    regions=[],
+)
+
+
+def _text(value) -> str:
+    """Строковое значение колонки справочника (NULL -> '')"""
+    return value if isinstance(value, str) else ''
+
+
+class DealerDirectory:
+    """Справочник дилеров с индексами по mobis_code, region и holding"""
+
+    def __init__(self, refresh_interval: int = 3600):
+        self.refresh_interval = refresh_interval
+        self._state = _EMPTY_STATE
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresh_thread = None
+
+    def load(self):
+        """Загружает dealers_data и атомарно подменяет индексы"""
+        logger.info('Загружаем справочник дилеров')
+        self.load_frame(db_connection.execute_query(DEALERS_QUERY))
+
+    def load_frame(self, df: pd.DataFrame):
+        """
+        Строит индексы по готовой таблице дилеров (например, из снимка)
+
+        Args:
+            df: DataFrame с колонками mobis_code, dealer_name, holding,
+                region
+        """
+        by_mobis_code = {}
+        by_region = {}
+        by_holding = {}
+        for row in df.itertuples(index=False):
+            dealer = {
+                'mobis_code': row.mobis_code,
+                'dealer_name': _text(row.dealer_name),
+                'holding': _text(row.holding),
+                'region': _text(row.region),
+            }
+            by_mobis_code[row.mobis_code] = dealer
+            if dealer['region']:
+                by_region.setdefault(
+                    dealer['region'], []
+                ).append(row.mobis_code)
+            if dealer['holding']:
+                by_holding.setdefault(
+                    dealer['holding'], []
+                ).append(row.mobis_code)
+
+        # Новое состояние подменяется одной ссылкой, читатели не блокируются
+        self._state = _DirectoryState(
+            dealers=df,
+            by_mobis_code=by_mobis_code,
+            by_region=by_region,
+            by_holding=by_holding,
+            regions=sorted(by_region),
+        )
+        self._loaded = True
+        logger.success(
+            f'Справочник дилеров загружен: {len(by_mobis_code)} дилеров, '
+            f'{len(by_region)} регионов, {len(by_holding)} холдингов'
+        )
+
+    @property
+    def loaded(self) -> bool:
+        """Загружен ли справочник"""
+        return self._loaded
+
+    def ensure_loaded(self):
+        """Загружает справочник при первом обращении и запускает обновление"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            self.load()
+            self.start_refresh()
+
+    def start_refresh(self):
+        """Запускает фоновое перечитывание справочника"""
+        if self.refresh_interval <= 0 or self._refresh_thread is not None:
+            return
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop,
+            name='dealer-directory-refresh',
+            daemon=True,
+        )
+        self._refresh_thread.start()
+
+    def stop_refresh(self):
+        """Останавливает фоновое перечитывание справочника"""
+        self._stop_event.set()
+
+    def _refresh_loop(self):
+        while not self._stop_event.wait(self.refresh_interval):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error(f'Ошибка обновления справочника дилеров: {e}')
+
+    def _current(self) -> _DirectoryState:
+        self.ensure_loaded()
+        return self._state
+
+    def dealers(self) -> pd.DataFrame:
+        """Все дилеры: mobis_code, dealer_name, holding, region"""
+        return self._current().dealers.copy()
+
+    def get(self, mobis_code) -> dict:
+        """Запись дилера по mobis_code или None"""
+        return self._current().by_mobis_code.get(mobis_code)
+
+    def region_of(self, mobis_code) -> str:
+        """Регион дилера или пустая строка"""
+        dealer = self.get(mobis_code)
+        return dealer['region'] if dealer else ''
+
+    def holding_of(self, mobis_code) -> str:
+        """Холдинг дилера или пустая строка"""
+        dealer = self.get(mobis_code)
+        return dealer['holding'] if dealer else ''
+
+    def regions(self) -> list:
+        """Отсортированный список регионов"""
+        return list(self._current().regions)
+
+    def holdings(self) -> list:
+        """Отсортированный список холдингов"""
+        return sorted(self._current().by_holding)
+
+    def mobis_codes(self) -> list:
+        """Отсортированный список всех mobis_code"""
+        return sorted(self._current().by_mobis_code)
+
+    def mobis_codes_by_region(self, region) -> list:
+        """mobis_code дилеров региона ('All' — все дилеры)"""
+        if region == 'All':
+            return self.mobis_codes()
+        return list(self._current().by_region.get(region, []))
+
+    def mobis_codes_by_holding(self, holding) -> list:
+        """mobis_code дилеров холдинга ('All' — все дилеры)"""
+        if holding == 'All':
+            return self.mobis_codes()
+        return list(self._current().by_holding.get(holding, []))
+
+
+# Глобальный справочник для использования в приложении
+dealer_directory = DealerDirectory(
+    refresh_interval=settings.database.dealers_refresh_interval
+)
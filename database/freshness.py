@@ -0,0 +1,251 @@
+"""
+Отслеживание изменений исходных данных DNM
+
+FreshnessWatcher сообщает подписчикам, какие (год, дилер) изменились,
+чтобы кеш сбрасывал только затронутые записи. Источники изменений:
+
+- watermark: периодически выполняется запрос DB_WATERMARK_QUERY,
+  который возвращает колонки year, watermark и (необязательно)
+  mobis_code — например, max(updated_at) по году и дилеру. Изменение
+  watermark относительно прошлого опроса означает новые данные;
+- LISTEN/NOTIFY: канал DB_NOTIFY_CHANNEL, payload — JSON вида
+  {"year": 2025, "mobis_code": "C001"} (mobis_code может быть списком
+  или отсутствовать — тогда изменились все дилеры года; пустой payload
+  означает изменение всех данных).
+
+Изменения передаются подписчикам словарем {год: множество mobis_code},
+где год None — все годы, а множество None — все дилеры года.
+"""
+import json
+import select
+import threading
+
+import psycopg2
+from psycopg2 import sql
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
+from loguru import logger
+
+from config import settings
+from database.connection import db_connection
+
+
+def _merge_change(changes: dict, year, mobis_codes):
+    """Добавляет изменение (год, дилеры) в словарь изменений"""
+    if year in changes and changes[year] is None:
+        return
+    if mobis_codes is None:
+        changes[year] = None
+    else:
+        changes.setdefault(year, set()).update(mobis_codes)
+
+
+def parse_notify_payload(payload: str) -> dict:
+    """
+    Разбирает payload уведомления NOTIFY в словарь изменений
+
+    Args:
+        payload: JSON {"year": ..., "mobis_code": ...} или пустая строка
+
+    Returns:
+        dict: {год: множество mobis_code или None}
+    """
+    if not payload:
+        return {None: None}
+    try:
+        data = json.loads(payload)
+        year = data.get('year')
+        year = int(year) if year is not None else None
+        mobis_codes = data.get('mobis_code')
+        if isinstance(mobis_codes, str):
+            mobis_codes = {mobis_codes}
+        elif mobis_codes is not None:
+            mobis_codes = set(mobis_codes)
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(
+            f'Некорректный payload уведомления {payload!r}: {e}, '
+            f'сбрасываем все данные'
+        )
+        return {None: None}
+    return {year: mobis_codes}
+
+
+class FreshnessWatcher:
+    """Отслеживает изменения данных по watermark и LISTEN/NOTIFY"""
+
+    def __init__(self, watermark_query: str = '', interval: int = 60,
+                 notify_channel: str = ''):
+        """
+        Args:
+            watermark_query: Запрос, возвращающий year, watermark и
+                             (необязательно) mobis_code
+            interval: Период опроса watermark, сек
+            notify_channel: Канал LISTEN/NOTIFY (пусто — не слушать)
+        """
+        self.watermark_query = watermark_query
+        self.interval = interval
+        self.notify_channel = notify_channel
+        self._watermarks = None
+        self._subscribers = []
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._listened = False
+        self.polls = 0
+        self.notifications = 0
+        self.changes_detected = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Настроен ли хотя бы один источник изменений"""
+        return bool(self.watermark_query or self.notify_channel)
+
+    def subscribe(self, callback):
+        """Регистрирует callback(changes), вызываемый при изменениях"""
+        self._subscribers.append(callback)
+
+    def start(self):
+        """Запускает фоновые потоки опроса watermark и LISTEN"""
+        if self._threads or not self.enabled:
+            return
+        if self.watermark_query and self.interval > 0:
+            self._start_thread(self._poll_loop, 'freshness-watermark')
+        if self.notify_channel:
+            self._start_thread(self._listen_loop, 'freshness-listen')
+        logger.info(
+            f'Отслеживание изменений данных запущено: '
+            f'watermark={bool(self.watermark_query)}, '
+            f'notify={self.notify_channel or "-"}'
+        )
+
+    def stop(self):
+        """Останавливает фоновые потоки"""
+        self._stop_event.set()
+
+    def _start_thread(self, target, name):
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def poll(self) -> dict:
+        """
+        Выполняет запрос watermark и сравнивает с прошлым опросом
+
+        Первый опрос только запоминает watermark. Найденные изменения
+        передаются подписчикам.
+
+        Returns:
+            dict: {год: множество mobis_code или None}
+        """
+        df = db_connection.execute_query(self.watermark_query)
+        has_dealer = 'mobis_code' in df.columns
+        watermarks = {}
+        for row in df.itertuples(index=False):
+            mobis_code = row.mobis_code if has_dealer else None
+            watermarks[(int(row.year), mobis_code)] = str(row.watermark)
+        self.polls += 1
+
+        previous = self._watermarks
+        self._watermarks = watermarks
+        if previous is None:
+            logger.info(
+                f'Watermark данных получен: {len(watermarks)} значений'
+            )
+            return {}
+
+        changes = {}
+        for key in previous.keys() | watermarks.keys():
+            if previous.get(key) != watermarks.get(key):
+                year, mobis_code = key
+                _merge_change(
+                    changes, year,
+                    None if mobis_code is None else {mobis_code}
+                )
+        self._publish(changes)
+        return changes
+
+    def _publish(self, changes: dict):
+        if not changes:
+            return
+        self.changes_detected += 1
+        logger.info(f'Обнаружены изменения данных: {_describe(changes)}')
+        for callback in self._subscribers:
+            try:
+                callback(changes)
+            except Exception as e:
+                logger.error(f'Ошибка обработки изменений данных: {e}')
+
+    def _poll_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f'Ошибка опроса watermark данных: {e}')
+            self._stop_event.wait(self.interval)
+
+    def _listen_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                logger.error(f'Ошибка LISTEN {self.notify_channel}: {e}')
+                self._stop_event.wait(self.interval)
+
+    def _listen(self):
+        # Отдельное соединение вне пула: оно занято LISTEN постоянно
+        conn = psycopg2.connect(**db_connection.config)
+        try:
+            conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+            with conn.cursor() as cursor:
+                cursor.execute(sql.SQL('LISTEN {}').format(
+                    sql.Identifier(self.notify_channel)
+                ))
+            logger.info(f'Слушаем канал {self.notify_channel}')
+            if self._listened:
+                # Пока соединения не было, уведомления могли пропасть
+                self._publish({None: None})
+            self._listened = True
+            while not self._stop_event.is_set():
+                if select.select([conn], [], [], 5) == ([], [], []):
+                    continue
+                conn.poll()
+                changes = {}
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    self.notifications += 1
+                    for year, codes in parse_notify_payload(
+                        notify.payload
+                    ).items():
+                        _merge_change(changes, year, codes)
+                self._publish(changes)
+        finally:
+            conn.close()
+
+    def stats(self) -> dict:
+        """Статистика отслеживания изменений"""
+        return {
+            'enabled': self.enabled,
+            'watermark_interval': self.interval,
+            'notify_channel': self.notify_channel,
+            'polls': self.polls,
+            'notifications': self.notifications,
+            'changes_detected': self.changes_detected,
+        }
+
+
+def _describe(changes: dict) -> str:
+    """Краткое описание изменений для лога"""
+    parts = []
+    for year, mobis_codes in changes.items():
+        year = 'все годы' if year is None else year
+        if mobis_codes is None:
+            parts.append(f'{year}: все дилеры')
+        else:
+            parts.append(f'{year}: {len(mobis_codes)} дилеров')
+    return ', '.join(parts)
+
+
+# Глобальный наблюдатель для использования в приложении
+freshness_watcher = FreshnessWatcher(
+    watermark_query=settings.database.watermark_query,
+    interval=settings.database.watermark_interval,
+    notify_channel=settings.database.notify_channel,
+)
@@ -1,8 +1,57 @@
+import hashlib
 import os
+import re
+from collections import namedtuple
 from functools import lru_cache
 
+import pandas as pd
 from loguru import logger
-from database.connection import db_connection
+
+from config import settings
+from database.connection import PrepareError, db_connection
+from database.dealers import dealer_directory
+from database.schema import apply_dnm_schema
+
+
+# Параметры фильтров, для которых 'All' означает "без фильтра"
+FILTER_PARAMS = ('selected_mobis_code', 'selected_holding', 'selected_region')
+
+# Предикат-заглушка в SQL скриптах:
+#   (%(selected_region)s = 'All' OR d.region = %(selected_region)s)
+_SENTINEL_PREDICATE = re.compile(
+    r"\(\s*(?:%\((?P<param>\w+)\)s\s*=\s*'All'"
+    r"|'All'\s*=\s*%\((?P<param_rev>\w+)\)s)"
+    r"\s+OR\s+(?P<column>[\w.\"]+)\s*=\s*%\((?P<ref>\w+)\)s\s*\)",
+    re.IGNORECASE
+)
+
+_NAMED_PARAM = re.compile(r'%\((\w+)\)s')
+
+DnmStatement = namedtuple(
+    'DnmStatement', ['name', 'sql', 'prepared_sql', 'param_names']
+)
+
+
+# Скрипты выборки дилер × модель (DATA_GRAIN=dealer, снимки). В
+# репозиторий не входят и добавляются в SQL/ вместе с остальными
+DEALER_SQL_FILES = {
+    '0-10Y': 'dnm_script_age_0_10_by_dealer.sql',
+    '0-5Y': 'dnm_script_age_0_5_by_dealer.sql',
+}
+
+
+def _sql_path(sql_filename: str) -> str:
+    return os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'SQL', sql_filename
+    )
+
+
+def missing_dealer_sql_files() -> list:
+    """Скрипты выборки дилер × модель, которых нет в директории SQL"""
+    return [
+        name for name in DEALER_SQL_FILES.values()
+        if not os.path.isfile(_sql_path(name))
+    ]
 
 
 @lru_cache(maxsize=10)
@@ -19,9 +68,7 @@ def load_sql_file(sql_filename: str) -> str:
     Note:
         Результаты кэшируются в памяти для ускорения повторных загрузок
     """
-    sql_file_path = os.path.join(
-        os.path.dirname(os.path.dirname(__file__)), 'SQL', sql_filename
-    )
+    sql_file_path = _sql_path(sql_filename)
 
     logger.debug(f'Загружаем SQL файл: {sql_file_path}')
 
@@ -35,31 +82,130 @@ def load_sql_file(sql_filename: str) -> str:
         raise FileNotFoundError(f'SQL файл не найден: {sql_file_path}')
 
 
-def get_dnm_data(
+@lru_cache(maxsize=64)
+def build_dnm_statement(sql_filename: str,
+                        active_filters: frozenset) -> DnmStatement:
+    """
+    Строит специализированный SQL для набора активных фильтров
+
+    Предикаты-заглушки вида (%(param)s = 'All' OR column = %(param)s)
+    для активных фильтров заменяются на column = %(param)s, для
+    неактивных — удаляются (TRUE). Так планировщик Postgres видит
+    только реальные условия и может использовать индексы, например,
+    по mobis_code. Варианты кешируются; prepared_sql — тот же запрос
+    с позиционными параметрами $n для PREPARE.
+
+    Args:
+        sql_filename: Имя SQL файла
+        active_filters: Имена параметров фильтров со значением не 'All'
+
+    Returns:
+        DnmStatement: Имя prepared statement, SQL с именованными
+                      параметрами, SQL для PREPARE и порядок параметров
+    """
+    query = load_sql_file(sql_filename)
+    rewritten = set()
+
+    def specialize(match):
+        param = match.group('param') or match.group('param_rev')
+        if param != match.group('ref') or param not in FILTER_PARAMS:
+            return match.group(0)
+        rewritten.add(param)
+        if param in active_filters:
+            return f'{match.group("column")} = %({param})s'
+        return 'TRUE'
+
+    sql = _SENTINEL_PREDICATE.sub(specialize, query)
+
+    missing = set(FILTER_PARAMS) - rewritten
+    if missing and _NAMED_PARAM.search(query):
+        logger.debug(
+            f'В {sql_filename} нет предикатов-заглушек для '
+            f'{sorted(missing)}, они остаются в общем виде'
+        )
+
+    param_names = []
+
+    def to_positional(match):
+        name = match.group(1)
+        if name not in param_names:
+            param_names.append(name)
+        return f'${param_names.index(name) + 1}'
+
+    prepared_sql = _NAMED_PARAM.sub(to_positional, sql).replace('%%', '%')
+    digest = hashlib.sha1(sql.encode('utf-8')).hexdigest()[:16]
+
+    logger.info(
+        f'Построен вариант запроса {sql_filename} для фильтров '
+        f'{sorted(active_filters) or "без фильтров"}'
+    )
+    return DnmStatement(
+        name=f'dnm_{digest}',
+        sql=sql,
+        prepared_sql=prepared_sql,
+        param_names=tuple(param_names),
+    )
+
+
+# Имена вариантов запроса, которые БД отказалась подготовить (PREPARE);
+# они выполняются через execute_query до перезапуска процесса
+_unpreparable = set()
+
+
+def _execute_prepared(statement, params):
+    """
+    Выполняет вариант запроса как prepared statement
+
+    Returns:
+        pd.DataFrame | None: Результат или None, если запрос нельзя
+                             подготовить (он помечается и дальше
+                             выполняется без PREPARE)
+    """
+    try:
+        return db_connection.execute_prepared(
+            statement.name, statement.prepared_sql,
+            [params[name] for name in statement.param_names]
+        )
+    except PrepareError as e:
+        _unpreparable.add(statement.name)
+        logger.warning(
+            f'{e}; вариант запроса {statement.name} выполняется '
+            f'без PREPARE'
+        )
+        return None
+
+
+def _build_dnm_query(
     selected_year: int = None,
     age_group: str = '0-10Y',
     selected_mobis_code: str = 'All',
     selected_holding: str = 'All',
     selected_region: str = 'All',
-    group_by_region: bool = False
+    group_by_region: bool = False,
+    group_by_dealer: bool = False
 ):
     """
-    Получает данные DNM из базы данных используя SQL скрипт
+    Подбирает SQL скрипт DNM и параметры запроса
 
     Args:
-        selected_year: Выбранный год для фильтрации данных.
-                      Если None, используется текущий год.
+        selected_year: Выбранный год. Если None, используется текущий год.
         age_group: Выбранная возрастная группа ('0-10Y' или '0-5Y').
         selected_mobis_code: Выбранный код дилера ('All' или конкретный код).
         selected_holding: Выбранный holding ('All' или конкретный holding).
         selected_region: Выбранный регион ('All' или конкретный регион).
         group_by_region: Если True, группирует данные по регионам.
+        group_by_dealer: Если True, группирует данные по дилерам
+                         (строка на дилера и модель, колонка mobis_code).
 
     Returns:
-        pd.DataFrame: Данные DNM
+        tuple: (DnmStatement для активных фильтров, параметры запроса)
     """
     # Определяем имя SQL файла в зависимости от возрастной группы и группировки
-    if group_by_region:
+    if group_by_dealer:
+        sql_filename = DEALER_SQL_FILES[
+            '0-5Y' if age_group == '0-5Y' else '0-10Y'
+        ]
+    elif group_by_region:
         if age_group == '0-5Y':
             sql_filename = 'dnm_script_age_0_5_by_region.sql'
         else:
@@ -70,91 +216,162 @@ def get_dnm_data(
         else:
             sql_filename = 'dnm_script_age_0_10.sql'
 
+    logger.info(
+        f'Загружаем данные DNM: год={selected_year}, группа={age_group}, '
+        f'дилер={selected_mobis_code}, холдинг={selected_holding}, '
+        f'регион={selected_region}, '
+        f'группировка_по_региону={group_by_region}, '
+        f'группировка_по_дилеру={group_by_dealer}'
+    )
+
+    # Если год не указан, используем текущий год
+    if selected_year is None:
+        from datetime import datetime
+        selected_year = datetime.now().year
+        logger.info(f'Год не указан, используем текущий: {selected_year}')
+
+    params = {
+        'selected_year': selected_year,
+        'selected_mobis_code': selected_mobis_code,
+        'selected_holding': selected_holding,
+        'selected_region': selected_region
+    }
+
+    active_filters = frozenset(
+        name for name in FILTER_PARAMS if params[name] != 'All'
+    )
+    # Вариант запроса берется из кэша (или строится при первом обращении)
+    statement = build_dnm_statement(sql_filename, active_filters)
+
+    if group_by_dealer:
+        logger.info('Выполняем запрос с группировкой по дилерам')
+    elif group_by_region:
+        logger.info('Выполняем запрос с группировкой по регионам')
+    else:
+        logger.info('Выполняем обычный запрос')
+
+    return statement, params
+
+
+def get_dnm_data(
+    selected_year: int = None,
+    age_group: str = '0-10Y',
+    selected_mobis_code: str = 'All',
+    selected_holding: str = 'All',
+    selected_region: str = 'All',
+    group_by_region: bool = False,
+    chunksize: int = None,
+    fetch_mode: str = None,
+    group_by_dealer: bool = False
+):
+    """
+    Получает данные DNM из базы данных используя SQL скрипт
+
+    Args:
+        selected_year: Выбранный год для фильтрации данных.
+                      Если None, используется текущий год.
+        age_group: Выбранная возрастная группа ('0-10Y' или '0-5Y').
+        selected_mobis_code: Выбранный код дилера ('All' или конкретный код).
+        selected_holding: Выбранный holding ('All' или конкретный holding).
+        selected_region: Выбранный регион ('All' или конкретный регион).
+        group_by_region: Если True, группирует данные по регионам.
+        chunksize: Если задан, результат читается порциями через
+                   server-side cursor и собирается в один DataFrame.
+        fetch_mode: Способ чтения результата ('rows' или 'copy'),
+                    см. DatabaseConnection.execute_query.
+        group_by_dealer: Если True, группирует данные по дилерам.
+
+    Returns:
+        pd.DataFrame: Данные DNM с типами из database.schema
+    """
     try:
-        logger.info(
-            f'Загружаем данные DNM: год={selected_year}, группа={age_group}, '
-            f'дилер={selected_mobis_code}, холдинг={selected_holding}, '
-            f'регион={selected_region}, '
-            f'группировка_по_региону={group_by_region}'
+        statement, params = _build_dnm_query(
+            selected_year, age_group, selected_mobis_code,
+            selected_holding, selected_region, group_by_region,
+            group_by_dealer
         )
 
-        # Читаем SQL скрипт из кэша (или из файла при первой загрузке)
-        query = load_sql_file(sql_filename)
-
-        # Если год не указан, используем текущий год
-        if selected_year is None:
-            from datetime import datetime
-            selected_year = datetime.now().year
-            logger.info(f'Год не указан, используем текущий: {selected_year}')
-
-        # Выполняем запрос с параметрами
-        params = {
-            'selected_year': selected_year,
-            'selected_mobis_code': selected_mobis_code,
-            'selected_holding': selected_holding,
-            'selected_region': selected_region
-        }
-
-        if group_by_region:
-            logger.info('Выполняем запрос с группировкой по регионам')
-        else:
-            logger.info('Выполняем обычный запрос')
-
-        df = db_connection.execute_query(query, params)
+        fetch_mode = fetch_mode or db_connection.fetch_mode
+        df = None
+        if chunksize:
+            df = pd.concat(
+                db_connection.iter_query(statement.sql, params, chunksize),
+                ignore_index=True
+            )
+        elif (fetch_mode == 'rows'
+              and settings.database.prepared_statements
+              and statement.name not in _unpreparable):
+            df = _execute_prepared(statement, params)
+        if df is None:
+            df = db_connection.execute_query(
+                statement.sql, params, fetch_mode
+            )
+        df = apply_dnm_schema(df)
         logger.success(f'Данные DNM успешно загружены: {len(df)} строк')
         return df
 
     except FileNotFoundError:
-        logger.error(f'SQL файл не найден: {sql_filename}')
+        logger.error('SQL файл DNM не найден')
         raise
     except Exception as e:
         logger.error(f'Ошибка при получении данных из базы: {e}')
         raise
 
 
+def iter_dnm_data(
+    selected_year: int = None,
+    age_group: str = '0-10Y',
+    selected_mobis_code: str = 'All',
+    selected_holding: str = 'All',
+    selected_region: str = 'All',
+    group_by_region: bool = False,
+    chunksize: int = None
+):
+    """
+    Отдает данные DNM порциями через server-side cursor
+
+    Аргументы совпадают с get_dnm_data. Подходит для потребителей,
+    которым не нужен весь результат сразу (например, экспорт в CSV).
+
+    Yields:
+        pd.DataFrame: Очередная порция данных DNM
+    """
+    statement, params = _build_dnm_query(
+        selected_year, age_group, selected_mobis_code,
+        selected_holding, selected_region, group_by_region
+    )
+    for chunk in db_connection.iter_query(statement.sql, params, chunksize):
+        yield apply_dnm_schema(chunk)
+
+
 def get_dealers_data():
     """
-    Получает данные дилеров из таблицы dealers_data
+    Получает данные дилеров из справочника dealers_data в памяти
 
     Returns:
         pd.DataFrame: Данные дилеров с колонками mobis_code, dealer_name,
                       holding, region
     """
-    logger.info('Загружаем данные дилеров')
-    query = """
-    SELECT mobis_code, dealer_name, holding, region
-    FROM public.dealers_data
-    WHERE mobis_code IS NOT NULL
-    ORDER BY mobis_code
-    """
-    df = db_connection.execute_query(query)
-    logger.success(f'Данные дилеров загружены: {len(df)} записей')
+    df = dealer_directory.dealers()
+    logger.debug(f'Данные дилеров из справочника: {len(df)} записей')
     return df
 
 
 def get_regions():
     """
-    Получает список уникальных регионов из таблицы dealers_data
+    Получает список уникальных регионов из справочника дилеров
 
     Returns:
         list: Список уникальных регионов
     """
-    logger.info('Загружаем список регионов')
-    query = """
-    SELECT DISTINCT region
-    FROM public.dealers_data
-    WHERE region IS NOT NULL AND region != ''
-    ORDER BY region
-    """
-    df = db_connection.execute_query(query)
-    regions = df['region'].tolist()
-    logger.success(f'Список регионов загружен: {len(regions)} регионов')
+    regions = dealer_directory.regions()
+    logger.debug(f'Список регионов из справочника: {len(regions)} регионов')
     return regions
 
 
 def get_region_by_mobis_code(mobis_code):
     """
-    Получает region по mobis_code из таблицы dealers_data
+    Получает region по mobis_code из справочника дилеров
 
     Args:
         mobis_code: Код дилера
@@ -168,22 +385,10 @@ def get_region_by_mobis_code(mobis_code):
         )
         return ''
 
-    logger.info(f'Получаем регион для дилера: {mobis_code}')
-    query = """
-    SELECT region
-    FROM public.dealers_data
-    WHERE mobis_code = %(mobis_code)s
-    """
-
-    df = db_connection.execute_query(
-        query, {'mobis_code': mobis_code}
-    )
-    if not df.empty:
-        region = df['region'].iloc[0] if df['region'].iloc[0] else ''
-        logger.success(f'Регион найден: {region}')
-        return region
-    logger.warning(f'Регион для дилера {mobis_code} не найден')
-    return ''
+    region = dealer_directory.region_of(mobis_code)
+    if not region:
+        logger.warning(f'Регион для дилера {mobis_code} не найден')
+    return region
 
 
 def get_mobis_codes_by_region(region):
@@ -191,32 +396,15 @@ def get_mobis_codes_by_region(region):
     Получает список mobis_code для указанного региона
 
     Args:
-        region: Название региона
+        region: Название региона ('All' — все дилеры)
 
     Returns:
         list: Список mobis_code
     """
-    logger.info(f'Получаем коды дилеров для региона: {region}')
-
-    if region == 'All':
-        query = """
-        SELECT mobis_code
-        FROM public.dealers_data
-        WHERE mobis_code IS NOT NULL
-        ORDER BY mobis_code
-        """
-    else:
-        query = """
-        SELECT mobis_code
-        FROM public.dealers_data
-        WHERE region = %(region)s AND mobis_code IS NOT NULL
-        ORDER BY mobis_code
-        """
-
-    df = db_connection.execute_query(query, {'region': region})
-    codes = df['mobis_code'].tolist()
-    logger.success(
-        f'Коды дилеров загружены: {len(codes)} кодов для региона {region}'
+    codes = dealer_directory.mobis_codes_by_region(region)
+    logger.debug(
+        f'Коды дилеров из справочника: {len(codes)} кодов '
+        f'для региона {region}'
     )
     return codes
 
@@ -252,6 +440,35 @@ def get_dnm_data_by_region(
     )
 
 
+def get_dnm_data_by_dealer(
+    selected_year: int = None,
+    age_group: str = '0-10Y'
+):
+    """
+    Получает данные DNM с разбивкой дилер × модель без фильтров
+
+    Результат содержит колонку mobis_code и служит основой для
+    агрегации любого выбора Holding / Region / Mobis Code в памяти.
+    Нужны скрипты DEALER_SQL_FILES, которых нет в репозитории; без
+    них поднимается FileNotFoundError, а вызывающий код (DATA_GRAIN=
+    dealer, средние по региону, снимки) переходит на запросы по
+    фильтрам.
+
+    Args:
+        selected_year: Выбранный год для фильтрации данных.
+                      Если None, используется текущий год.
+        age_group: Выбранная возрастная группа ('0-10Y' или '0-5Y').
+
+    Returns:
+        pd.DataFrame: Данные DNM по дилерам и моделям
+    """
+    return get_dnm_data(
+        selected_year=selected_year,
+        age_group=age_group,
+        group_by_dealer=True
+    )
+
+
 def test_database_connection():
     """
     Тестирует подключение к базе данных
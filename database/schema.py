@@ -0,0 +1,94 @@
+"""
+Схема колонок результата DNM-запросов
+
+Типы задаются при получении данных из БД: счетчики — int32,
+денежные суммы и средние чеки — float64 (float32 искажает суммы
+в рублях уже с 8 значащих цифр), нормо-часы, UIO и доли — float32,
+модель — category.
+"""
+import pandas as pd
+
+
+# Счетчики: заказ-наряды по возрастам и UIO
+COUNT_COLUMNS = (
+    [f'age_{year}' for year in range(0, 11)] +
+    [
+        'age_0_3', 'age_4_5', 'age_6_10',
+        'total_0_10', 'total_0_5',
+        'uio', 'uio_10y', 'uio_5y',
+    ]
+)
+
+# Денежные суммы и средние чеки
+MONEY_COLUMNS = [
+    'total_ro_cost', 'avg_ro_cost',
+    'labor_amount_0_10', 'labor_amount_0_5', 'avg_ro_labor_cost',
+    'parts_amount_0_10', 'parts_amount_0_5', 'avg_ro_part_cost',
+]
+
+# Нормо-часы, средние UIO и доли
+FLOAT_COLUMNS = [
+    'labor_hours_0_10', 'labor_hours_0_5', 'aver_labor_hours_per_vhc',
+    'avg_uio_10y', 'avg_uio_5y',
+    'ro_ratio_of_uio_10y', 'ro_ratio_of_uio_5y',
+    'pct_age_0_3', 'pct_age_4_5', 'pct_age_6_10',
+]
+
+CATEGORY_COLUMNS = ['model']
+
+# Текстовые колонки справочника дилеров, которые не приводятся к числам
+TEXT_COLUMNS = ['mobis_code', 'dealer_name', 'holding', 'region']
+
+DNM_SCHEMA = {
+    **{col: 'int32' for col in COUNT_COLUMNS},
+    **{col: 'float64' for col in MONEY_COLUMNS},
+    **{col: 'float32' for col in FLOAT_COLUMNS},
+    **{col: 'category' for col in CATEGORY_COLUMNS},
+}
+
+
+def apply_dnm_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Приводит колонки DataFrame DNM к типам схемы
+
+    Колонки, уже имеющие нужный тип, не трогаются, поэтому повторный
+    вызов на типизированном DataFrame практически бесплатен. Колонки
+    вне схемы с типом object приводятся к числам (кроме текстовых).
+    Все приведения типов выполняются одним вызовом astype.
+
+    Args:
+        df: DataFrame с результатом DNM-запроса
+
+    Returns:
+        pd.DataFrame: DataFrame с приведенными типами
+    """
+    casts = {}
+    to_numeric = []
+    for col, dtype in df.dtypes.items():
+        target = DNM_SCHEMA.get(col)
+        if target is None:
+            if dtype == object and col not in TEXT_COLUMNS:
+                to_numeric.append(col)
+            continue
+        if dtype == target:
+            continue
+        if dtype == object and target != 'category':
+            to_numeric.append(col)
+        casts[col] = target
+
+    if not casts and not to_numeric:
+        return df
+
+    # Строковые значения (например, из CSV) разбираются как числа
+    converted = {
+        col: pd.to_numeric(df[col], errors='coerce') for col in to_numeric
+    }
+    # Пропуски в счетчиках заменяются нулями до приведения к int32
+    for col, target in casts.items():
+        if target == 'int32':
+            values = converted.get(col, df[col])
+            if values.isna().any():
+                converted[col] = values.fillna(0)
+    if converted:
+        df = df.assign(**converted)
+    return df.astype(casts) if casts else df
@@ -0,0 +1,222 @@
+"""
+Снимки данных DNM на диске
+
+Периодически выборка дилер × модель за каждый (год, возрастная
+группа) и справочник дилеров сохраняются в файлы Arrow IPC без
+сжатия. Файлы читаются через memory map без копирования, поэтому
+служат быстрым источником данных, когда БД недоступна, и основой
+офлайн-режима (SNAPSHOT_OFFLINE).
+
+Данные закрытых лет снимаются один раз, текущего года — при каждом
+обновлении.
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from loguru import logger
+
+from config import settings
+from database.dealers import dealer_directory
+from database.queries import get_dnm_data_by_dealer
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+AGE_GROUPS = ('0-10Y', '0-5Y')
+DEALERS_SNAPSHOT = 'dealers'
+
+
+class SnapshotStore:
+    """Снимки выборок дилер × модель в файлах Arrow IPC"""
+
+    def __init__(self, directory: str, interval: int = 86400,
+                 years: int = 6):
+        """
+        Args:
+            directory: Каталог снимков
+            interval: Период обновления снимков, сек (0 — только при
+                      запуске)
+            years: Сколько последних лет (включая текущий) снимать
+        """
+        self.directory = directory
+        self.interval = interval
+        self.years = years
+        self._frames = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.last_refresh = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}.arrow')
+
+    @staticmethod
+    def _name(selected_year, age_group) -> str:
+        return f'dnm_{selected_year}_{age_group}'
+
+    def write(self, name: str, df):
+        """Атомарно сохраняет DataFrame в файл Arrow IPC"""
+        path = self._path(name)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        try:
+            with pa.OSFile(tmp_path, 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def read(self, name: str):
+        """
+        Читает снимок через memory map
+
+        DataFrame кешируется до изменения файла; числовые колонки
+        ссылаются на отображенную память без копирования.
+
+        Returns:
+            pd.DataFrame | None: Данные снимка или None, если его нет
+        """
+        path = self._path(name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return None
+
+        with self._lock:
+            cached = self._frames.get(name)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+        source = pa.memory_map(path, 'r')
+        table = pa.ipc.open_file(source).read_all()
+        df = table.to_pandas(split_blocks=True)
+        with self._lock:
+            self._frames[name] = (mtime, df)
+        return df
+
+    def exists(self, name: str) -> bool:
+        """Есть ли снимок"""
+        return os.path.exists(self._path(name))
+
+    def dnm_frame(self, selected_year, age_group):
+        """Выборка дилер × модель из снимка или None"""
+        return self.read(self._name(selected_year, age_group))
+
+    def dealers(self):
+        """Справочник дилеров из снимка или None"""
+        return self.read(DEALERS_SNAPSHOT)
+
+    def refresh(self) -> int:
+        """
+        Снимает данные из БД
+
+        Закрытые годы, для которых снимок уже есть, пропускаются.
+        Ошибка одного снимка записывается в лог и не прерывает
+        остальные; прежний файл этого снимка остается на диске.
+
+        Returns:
+            int: Количество записанных снимков
+        """
+        current_year = datetime.now().year
+        started = time.perf_counter()
+        written = 0
+        failed = []
+
+        try:
+            self.write(DEALERS_SNAPSHOT, dealer_directory.dealers())
+        except Exception as e:
+            failed.append(DEALERS_SNAPSHOT)
+            logger.error(f'Не удалось снять {DEALERS_SNAPSHOT}: {e}')
+        for year in range(current_year - self.years + 1, current_year + 1):
+            for age_group in AGE_GROUPS:
+                name = self._name(year, age_group)
+                if year < current_year and self.exists(name):
+                    continue
+                try:
+                    self.write(name, get_dnm_data_by_dealer(year, age_group))
+                except Exception as e:
+                    failed.append(name)
+                    logger.error(f'Не удалось снять {name}: {e}')
+                    continue
+                written += 1
+                logger.info(f'Снимок {name} сохранен')
+
+        self.last_refresh = {
+            'written': written,
+            'failed': failed,
+            'seconds': round(time.perf_counter() - started, 2),
+            'at': datetime.now().isoformat(timespec='seconds'),
+        }
+        message = (
+            f'Снимки данных обновлены: {written} файлов за '
+            f'{self.last_refresh["seconds"]} с'
+        )
+        if failed:
+            logger.warning(f'{message}, ошибки: {", ".join(failed)}')
+        else:
+            logger.success(message)
+        return written
+
+    def start(self):
+        """Запускает обновление снимков в фоновом потоке"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(
+            target=self._loop, name='dnm-snapshots', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """Останавливает обновление снимков"""
+        self._stop_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f'Ошибка обновления снимков данных: {e}')
+            if self.interval <= 0:
+                return
+            self._stop_event.wait(self.interval)
+
+    def stats(self) -> dict:
+        """Список снимков и итог последнего обновления"""
+        return {
+            'directory': self.directory,
+            'files': sorted(
+                filename for filename in os.listdir(self.directory)
+                if filename.endswith('.arrow')
+            ),
+            'last_refresh': self.last_refresh,
+        }
+
+
+def _create_snapshot_store():
+    """Хранилище снимков (если задан SNAPSHOT_DIR и есть pyarrow)"""
+    if not settings.snapshot.dir:
+        return None
+    if not PYARROW_AVAILABLE:
+        logger.warning(
+            'pyarrow не установлен, снимки данных отключены. '
+            'Установите: pip install pyarrow'
+        )
+        return None
+    return SnapshotStore(
+        settings.snapshot.dir,
+        interval=settings.snapshot.interval,
+        years=settings.snapshot.years,
+    )
+
+
+# Глобальное хранилище снимков (None — снимки отключены)
+snapshot_store = _create_snapshot_store()
@@ -0,0 +1,143 @@
+"""
+Агрегация в памяти: вывод 0-5Y из результата 0-10Y и куб дилер × модель
+"""
+import numpy as np
+import pandas as pd
+
+from app.aggregation import (
+    age_0_5_sources,
+    aggregate_dealers,
+    derive_age_0_5,
+    recompute_derived
+)
+from app.cube import DealerCube
+from database.schema import DNM_SCHEMA, apply_dnm_schema
+
+DEALERS = ['D1', 'D2', 'D3', 'D4', 'D5']
+
+
+def make_superset(rows=20, seed=0, by_age=True):
+    """Результат 0-10Y; by_age — с показателями по отдельным возрастам"""
+    rng = np.random.default_rng(seed)
+    data = {'model': [f'M{i}' for i in range(rows)]}
+    for age in range(11):
+        data[f'age_{age}'] = rng.integers(0, 200, rows)
+    data['total_0_10'] = sum(data[f'age_{age}'] for age in range(11))
+    data['uio_5y'] = rng.integers(100, 3000, rows)
+    data['avg_uio_5y'] = rng.uniform(100, 3000, rows)
+    data['labor_hours_0_5'] = rng.uniform(0, 500, rows)
+    data['total_ro_cost'] = rng.uniform(1e5, 1e7, rows)
+    if by_age:
+        for name in ('ro_cost', 'labor_amount', 'parts_amount'):
+            for age in range(6):
+                data[f'{name}_age_{age}'] = rng.uniform(1e3, 1e5, rows)
+    return pd.DataFrame(data)
+
+
+def test_sources_are_checked_on_column_names():
+    assert age_0_5_sources(make_superset(by_age=False).columns) is None
+
+    sources = age_0_5_sources(make_superset().columns)
+    assert sources['total_0_5'] == [f'age_{age}' for age in range(6)]
+    assert sources['uio_5y'] == ['uio_5y']
+
+
+def test_derive_age_0_5_sums_ages_0_to_5():
+    frame = make_superset()
+
+    df = derive_age_0_5(frame)
+
+    ages = [f'age_{age}' for age in range(6)]
+    ro_cost = [f'ro_cost_age_{age}' for age in range(6)]
+    assert (df['total_0_5'].to_numpy()
+            == frame[ages].to_numpy().sum(axis=1)).all()
+    np.testing.assert_allclose(df['total_ro_cost'].to_numpy(),
+                               frame[ro_cost].to_numpy().sum(axis=1),
+                               rtol=1e-6)
+    assert derive_age_0_5(make_superset(by_age=False)) is None
+
+
+def make_dealer_frame(seed=0):
+    """Выборка дилер × модель 0-10Y; часть пар дилер-модель пропущена"""
+    rng = np.random.default_rng(seed)
+    pairs = [
+        (dealer, f'M{model}') for dealer in DEALERS for model in range(8)
+        if rng.random() > 0.25
+    ]
+    rows = len(pairs)
+    data = {
+        'mobis_code': [dealer for dealer, _ in pairs],
+        'model': [model for _, model in pairs],
+    }
+    for age in range(11):
+        data[f'age_{age}'] = rng.integers(0, 200, rows)
+    data['age_0_3'] = sum(data[f'age_{age}'] for age in range(4))
+    data['age_4_5'] = data['age_4'] + data['age_5']
+    data['age_6_10'] = sum(data[f'age_{age}'] for age in range(6, 11))
+    data['total_0_10'] = data['age_0_3'] + data['age_4_5'] + data['age_6_10']
+    data['uio_10y'] = rng.integers(100, 5000, rows)
+    data['avg_uio_10y'] = rng.uniform(100, 5000, rows)
+    data['total_ro_cost'] = rng.uniform(1e5, 1e8, rows)
+    data['labor_hours_0_10'] = rng.uniform(10, 5000, rows)
+    for col in ('avg_ro_cost', 'aver_labor_hours_per_vhc', 'pct_age_0_3',
+                'ro_ratio_of_uio_10y'):
+        data[col] = 0.0
+    return apply_dnm_schema(pd.DataFrame(data))
+
+
+def by_model(df):
+    df = df.assign(model=df['model'].astype(str))
+    return df.sort_values('model').reset_index(drop=True)
+
+
+def assert_frames_close(result, expected):
+    assert list(result.columns) == list(expected.columns)
+    assert result['model'].tolist() == expected['model'].tolist()
+    for col in result.columns[1:]:
+        np.testing.assert_allclose(
+            result[col].to_numpy(dtype='float64'),
+            expected[col].to_numpy(dtype='float64'),
+            rtol=1e-5, err_msg=col
+        )
+
+
+def test_cube_rollup_matches_aggregate_dealers():
+    frame = make_dealer_frame()
+    cube = DealerCube(frame)
+
+    for codes in (None, ['D2'], ['D1', 'D3', 'D5'], ['D9']):
+        assert_frames_close(by_model(cube.rollup(codes)),
+                            by_model(aggregate_dealers(frame, codes)))
+
+
+def test_cube_average_is_mean_over_dealers_with_rows():
+    frame = make_dealer_frame(seed=1)
+    codes = ['D1', 'D2', 'D4']
+    cube = DealerCube(frame)
+
+    selected = frame[frame['mobis_code'].isin(codes)]
+    expected = (
+        selected.groupby('model', observed=True)[cube.measures]
+        .mean()
+        .reset_index()
+    )
+    for col in cube.derived:
+        expected[col] = 0.0
+    expected = recompute_derived(expected[cube.columns], '0-10Y')
+    for col in cube.columns[1:]:
+        if DNM_SCHEMA.get(col) == 'int32':
+            expected[col] = np.rint(expected[col])
+
+    assert_frames_close(by_model(cube.rollup(codes, average=True)),
+                        by_model(expected))
+
+
+def test_cube_drops_rows_without_keys():
+    frame = make_dealer_frame(seed=2)
+    extra = frame.head(2).astype({'model': object})
+    extra.iloc[0, extra.columns.get_loc('mobis_code')] = None
+    extra.iloc[1, extra.columns.get_loc('model')] = None
+    broken = pd.concat([frame, extra], ignore_index=True)
+
+    assert_frames_close(by_model(DealerCube(broken).rollup()),
+                        by_model(DealerCube(frame).rollup()))
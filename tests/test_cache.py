@@ -0,0 +1,80 @@
+"""
+Поведение ResultCache: данные только для чтения, stale-while-revalidate
+и кеш на диске
+"""
+import os
+import time
+
+import pandas as pd
+import pytest
+
+from app.cache import PYARROW_AVAILABLE, ParquetStore, ResultCache
+
+
+def wait_refreshed(cache, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while cache.stats()['refreshing'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_background_refresh_does_not_reuse_stale_inner_entries():
+    cache = ResultCache('test', max_bytes=1 << 20, ttl=0.05,
+                        stale_while_revalidate=True)
+    versions = iter(range(1, 100))
+
+    def load_view():
+        data = cache.get_or_load('data', lambda: next(versions))
+        return ('view', data)
+
+    assert cache.get_or_load('view', load_view) == ('view', 1)
+    time.sleep(0.1)
+
+    # Истекшее представление отдается сразу, а пересобирается из
+    # свежих данных, а не из истекшей записи 'data'
+    assert cache.get_or_load('view', load_view) == ('view', 1)
+    wait_refreshed(cache)
+    assert cache.get('view') == ('view', 2)
+    assert cache.get('data') == 2
+
+
+def test_cached_frames_are_read_only_without_global_options():
+    cache = ResultCache('test', max_bytes=1 << 20)
+    cache.set('data', pd.DataFrame({'model': ['A', 'B'],
+                                    'total_0_10': [1, 2],
+                                    'total_ro_cost': [10.0, 20.0]}))
+
+    df = cache.get('data')
+    df['total_0_10'] = [5, 6]
+    with pytest.raises(ValueError):
+        df.loc[0, 'total_ro_cost'] = 0.0
+
+    assert pd.get_option('mode.copy_on_write') is False
+    assert cache.get('data')['total_0_10'].tolist() == [1, 2]
+    assert cache.get('data')['total_ro_cost'].tolist() == [10.0, 20.0]
+
+
+@pytest.mark.skipif(not PYARROW_AVAILABLE, reason='нужен pyarrow')
+def test_store_locks_only_persisted_keys_and_purges_stale_locks(tmp_path):
+    store = ParquetStore(str(tmp_path))
+    cache = ResultCache('test', max_bytes=1 << 20, store=store,
+                        persist=lambda key: key[0] == 'dnm')
+
+    cache.get_or_load(('dnm', 1), lambda: pd.DataFrame({'total_0_10': [1]}))
+    cache.get_or_load(('view', 1), lambda: ('view', 1))
+
+    files = sorted(os.listdir(tmp_path))
+    assert files == sorted([
+        os.path.basename(store._path(('dnm', 1))),
+        os.path.basename(store._path(('dnm', 1), '.lock')),
+    ])
+
+    # Блокировка без записи старше часа удаляется, при записи — нет
+    orphan = store._path(('dnm', 2), '.lock')
+    open(orphan, 'a').close()
+    old = time.time() - 7200
+    for path in (orphan, store._path(('dnm', 1), '.lock')):
+        os.utime(path, (old, old))
+
+    assert store.purge() == 1
+    assert not os.path.exists(orphan)
+    assert os.path.exists(store._path(('dnm', 1), '.lock'))
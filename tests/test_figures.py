@@ -0,0 +1,311 @@
+"""
+Сверка фигур-словарей с прежней сборкой через plotly graph_objects
+
+Прежние фигуры встраивали шаблон plotly по умолчанию и полный layout
+темы, новые — компактный шаблон темы и только свои настройки, поэтому
+сравнивается фигура с примененным шаблоном (то, что рисует браузер).
+"""
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
+
+from app.constants import ACCENT_2, FONT_STACK, MONO_STACK, THEMES
+from app.plotly_templates import (
+    TOP_MODELS,
+    THEME_TEMPLATES,
+    _UNUSED_TEMPLATE_LAYOUT,
+    _fmt,
+    _hex2rgb,
+    age_groups,
+    age_sort_column,
+    build_dashboard_figures,
+    ramp,
+    rank_models,
+    ranked_bar,
+    top_models
+)
+
+
+def legacy_base_layout(theme, **extra):
+    """Прежний base_layout: весь layout темы в каждой фигуре"""
+    tok = THEMES[theme]
+    lay = dict(
+        paper_bgcolor=tok['paper'],
+        plot_bgcolor=tok['plot'],
+        font=dict(family=FONT_STACK, size=12, color=tok['font']),
+        margin=dict(l=8, r=14, t=14, b=44),
+        bargap=0.42,
+        showlegend=False,
+        hoverlabel=dict(
+            bgcolor=tok['surface'],
+            bordercolor=tok['border'],
+            font=dict(family=MONO_STACK, size=12, color=tok['text']),
+        ),
+        xaxis=dict(
+            tickfont=dict(size=11, color=tok['axis']),
+            showgrid=False, zeroline=False, fixedrange=True,
+            automargin=True, showline=False, tickangle=-45,
+        ),
+        yaxis=dict(
+            visible=False, showgrid=False, zeroline=False,
+            fixedrange=True,
+        ),
+    )
+    lay.update(extra)
+    return lay
+
+
+def legacy_ranked_bar(df, value_key, value_fmt='abbr', top=TOP_MODELS,
+                      theme='dark', currency=None, region_df=None,
+                      region_key=None, region_label='Region Average'):
+    """Прежний ranked_bar на go.Figure"""
+    tok = THEMES[theme]
+    region_key = region_key or value_key
+
+    data = df if top is None else top_models(df, value_key, top)
+
+    x = data['model'].tolist()
+    y = data[value_key].tolist()
+    labels = [_fmt(value_fmt, v) for v in y]
+    if currency:
+        hover = [f'{v:,.0f} {currency}' if pd.notna(v) else ''
+                 for v in y]
+    elif value_fmt in ('pct1', 'pct2'):
+        hover = [f'{v:.2f}%' if pd.notna(v) else '' for v in y]
+    else:
+        hover = [f'{v:,.0f}' if pd.notna(v) else '' for v in y]
+
+    fig = go.Figure(go.Bar(
+        x=x, y=y,
+        marker=dict(
+            color=ramp(tok['accent'], len(y)),
+            cornerradius=5, line=dict(width=0),
+        ),
+        text=labels, textposition='outside', cliponaxis=False,
+        textfont=dict(family=MONO_STACK, size=10.5, color=tok['font']),
+        customdata=hover,
+        hovertemplate='<b>%{x}</b><br>%{customdata}<extra></extra>',
+    ))
+
+    lay = legacy_base_layout(theme)
+    valid_y = [v for v in y if pd.notna(v)] or [1]
+    lay['yaxis']['range'] = [0, max(valid_y) * 1.18]
+
+    # Region Average overlay (secondary axis)
+    if (region_df is not None and not region_df.empty
+            and region_key in region_df.columns):
+        reg = region_df[region_df['model'].isin(x)]
+        if not reg.empty:
+            hov = (
+                '<b>%{x}</b><br>%{y:,.0f} · '
+                + region_label + '<extra></extra>'
+            )
+            fig.add_trace(go.Scatter(
+                x=reg['model'].tolist(),
+                y=reg[region_key].tolist(),
+                mode='markers', name=region_label, yaxis='y2',
+                marker=dict(
+                    size=9, symbol='circle', color=ACCENT_2,
+                    line=dict(width=1.5, color=tok['surface']),
+                ),
+                hovertemplate=hov,
+            ))
+            lay['showlegend'] = True
+            lay['legend'] = dict(
+                orientation='h', y=1.12, x=1, xanchor='right',
+                font=dict(size=10.5, color=tok['font']),
+                bgcolor='rgba(0,0,0,0)',
+            )
+            lay['yaxis2'] = dict(
+                overlaying='y', side='right', showgrid=False,
+                zeroline=False, fixedrange=True,
+                tickfont=dict(size=10, color=tok['axis']),
+                tickformat='~s',
+            )
+
+    fig.update_layout(lay)
+    return fig
+
+
+def legacy_age_groups(df, age_group='0-10Y', theme='dark', top=TOP_MODELS):
+    """Прежний age_groups на go.Figure"""
+    tok = THEMES[theme]
+    r, g, b = _hex2rgb(tok['accent'])
+
+    avg_uio_col = 'avg_uio_5y' if age_group == '0-5Y' else 'avg_uio_10y'
+
+    data = (df if top is None
+            else top_models(df, age_sort_column(df, age_group), top))
+    order = data['model'].tolist()
+
+    bands = [
+        ('age_0_3', '0-3 years', 0.92),
+        ('age_4_5', '4-5 years', 0.55),
+    ]
+    if age_group != '0-5Y':
+        bands.append(('age_6_10', '6-10 years', 0.32))
+
+    traces = []
+    for col, name, alpha in bands:
+        if col not in data.columns:
+            continue
+        vals = data[col].tolist()
+        hov = '%{x} · ' + name + '<br>%{y:,} RO<extra></extra>'
+        traces.append(go.Bar(
+            name=name, x=order, y=vals,
+            marker=dict(
+                color=f'rgba({r},{g},{b},{alpha})', cornerradius=3,
+            ),
+            text=['' if pd.isna(v) else f'{v:,.0f}' for v in vals],
+            textposition='outside', cliponaxis=False,
+            constraintext='none',
+            textfont=dict(family=MONO_STACK, size=9, color=tok['font']),
+            hovertemplate=hov,
+        ))
+
+    if avg_uio_col in data.columns:
+        r2, g2, b2 = _hex2rgb(ACCENT_2)
+        uio_color = f'rgba({r2},{g2},{b2},0.5)'
+        traces.append(go.Scatter(
+            name='AVG UIO', x=order, y=data[avg_uio_col].tolist(),
+            mode='lines+markers', yaxis='y2',
+            line=dict(color=uio_color, width=1.5, shape='spline'),
+            marker=dict(size=5, color=uio_color),
+            hovertemplate='%{x} · AVG UIO<br>%{y:,}<extra></extra>',
+        ))
+
+    lay = legacy_base_layout(
+        theme, barmode='group',
+        bargap=0.25, bargroupgap=0.08,
+        margin=dict(l=8, r=42, t=30, b=44), showlegend=True,
+        legend=dict(
+            orientation='h', y=1.16, x=0,
+            font=dict(size=11, color=tok['font']),
+            bgcolor='rgba(0,0,0,0)',
+        ),
+        yaxis=dict(
+            visible=False, showgrid=False, zeroline=False,
+            fixedrange=True,
+        ),
+        yaxis2=dict(
+            overlaying='y', side='right', showgrid=False,
+            zeroline=False, fixedrange=True,
+            tickfont=dict(size=10, color=tok['axis']),
+            tickformat='~s',
+        ),
+    )
+    fig = go.Figure(traces)
+    fig.update_layout(lay)
+    return fig
+
+
+def as_json(fig):
+    """Фигура в том виде, в каком ее получает браузер"""
+    if isinstance(fig, go.Figure):
+        fig = fig.to_plotly_json()
+    return json.loads(to_json_plotly(fig))
+
+
+def merge(base, override):
+    """Глубокое слияние словарей, значения override главнее"""
+    out = dict(base)
+    for key, value in override.items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = merge(out[key], value)
+        else:
+            out[key] = value
+    return out
+
+
+def rendered(fig):
+    """
+    Фигура с примененным шаблоном, как его применяет plotly.js
+
+    Шаблон layout задает значения по умолчанию (шаблон yaxis — для
+    всех осей y), шаблон трасс — по типу трассы. Части шаблона,
+    которые не влияют на фигуры дашборда, не сравниваются.
+    """
+    fig = as_json(fig)
+    template = fig['layout'].pop('template')
+    defaults = {
+        key: value for key, value in template['layout'].items()
+        if key not in _UNUSED_TEMPLATE_LAYOUT
+    }
+    layout = merge(defaults, fig['layout'])
+    for axis in layout:
+        if axis.startswith('yaxis') and axis != 'yaxis':
+            layout[axis] = merge(defaults.get('yaxis', {}), layout[axis])
+    data = [
+        merge(template['data'].get(trace['type'], [{}])[0], trace)
+        for trace in fig['data']
+    ]
+    return {'data': data, 'layout': layout}
+
+
+def make_frame(rows=40, seed=0):
+    """Обработанные данные дашборда с пропусками и строкой TOTAL"""
+    rng = np.random.default_rng(seed)
+    data = {'model': [f'M{i}' for i in range(rows)] + ['TOTAL']}
+    for col in ('total_ro_cost', 'labor_hours_0_10', 'labor_hours_0_5',
+                'aver_labor_hours_per_vhc', 'avg_ro_cost',
+                'ro_ratio_of_uio_10y', 'avg_uio_10y', 'avg_uio_5y'):
+        data[col] = rng.uniform(0, 1e7, rows + 1)
+    for col in ('total_0_10', 'total_0_5', 'age_0_3', 'age_4_5',
+                'age_6_10'):
+        data[col] = rng.integers(0, 5000, rows + 1)
+    frame = pd.DataFrame(data)
+    frame.loc[3, 'avg_ro_cost'] = np.nan
+    return frame
+
+
+def test_ranked_bar_matches_graph_objects():
+    frame = make_frame()
+    region = make_frame(seed=1)
+    for theme in THEMES:
+        for value_fmt, currency in (('abbr', 'RUB'), ('float1', None),
+                                    ('pct1', None)):
+            for region_df in (None, region):
+                kwargs = dict(value_fmt=value_fmt, theme=theme,
+                              currency=currency, region_df=region_df)
+                fig = ranked_bar(frame, 'avg_ro_cost', **kwargs)
+                expected = legacy_ranked_bar(frame, 'avg_ro_cost', **kwargs)
+                assert rendered(fig) == rendered(expected)
+
+
+def test_age_groups_matches_graph_objects():
+    frame = make_frame()
+    for theme in THEMES:
+        for age_group in ('0-10Y', '0-5Y'):
+            assert rendered(age_groups(frame, age_group, theme)) \
+                == rendered(legacy_age_groups(frame, age_group, theme))
+
+
+def test_dashboard_figures_match_graph_objects():
+    frame = make_frame(rows=80)
+    region = make_frame(rows=80, seed=2)
+    ranked = rank_models(frame, '0-10Y')
+    figures = build_dashboard_figures(frame, '0-10Y', region, 'dark')
+
+    for key, col in (('fig_profit', 'total_ro_cost'),
+                     ('fig_avg_check', 'avg_ro_cost')):
+        expected = legacy_ranked_bar(
+            ranked[col], col, value_fmt='abbr', top=None, theme='dark',
+            currency='RUB', region_df=region
+        )
+        assert rendered(figures[key]) == rendered(expected), key
+    assert rendered(figures['fig_ro_years']) == rendered(
+        legacy_age_groups(ranked[age_sort_column(frame)], theme='dark',
+                          top=None)
+    )
+
+
+def test_figures_reference_shared_theme_template():
+    frame = make_frame()
+    for theme in THEMES:
+        figures = build_dashboard_figures(frame, '0-10Y', None, theme)
+        for fig in figures.values():
+            assert fig['layout']['template'] is THEME_TEMPLATES[theme]
+            assert 'paper_bgcolor' not in fig['layout']
@@ -0,0 +1,77 @@
+"""
+Сверка векторных производных показателей с построчным расчетом
+"""
+import numpy as np
+import pandas as pd
+
+from app.aggregation import recompute_derived
+from app.metrics import add_metrics, compute_metric
+
+
+def make_frame(rows=2000, seed=0):
+    """Агрегированные показатели 0-5Y с нулевыми знаменателями"""
+    rng = np.random.default_rng(seed)
+    frame = pd.DataFrame({
+        'model': [f'M{i}' for i in range(rows)],
+        'total_0_5': rng.integers(0, 500, rows),
+        'avg_uio_5y': rng.uniform(0, 2000, rows),
+        'uio_5y': rng.integers(0, 3000, rows),
+        'total_ro_cost': rng.uniform(1e4, 1e7, rows),
+        'age_0_3': rng.integers(0, 300, rows),
+    })
+    frame.loc[::9, 'avg_uio_5y'] = 0
+    frame.loc[::11, 'total_0_5'] = 0
+    return frame
+
+
+def test_ratio_matches_row_wise_apply():
+    frame = make_frame()
+    expected = frame.apply(
+        lambda row: (
+            round(100 * row['total_0_5'] / row['avg_uio_5y'], 2)
+            if row['avg_uio_5y'] > 0 else 0
+        ),
+        axis=1,
+    )
+
+    result = compute_metric('ro_ratio_of_avg_uio_5y', frame, '0-5Y')
+
+    np.testing.assert_allclose(result, expected.to_numpy(), atol=1e-9)
+
+
+def test_zero_guard_and_scalar_totals():
+    totals = {'total_ro_cost': 1500.0, 'total_0_5': 0}
+    assert float(compute_metric('avg_ro_cost', totals, '0-5Y')) == 0.0
+
+    totals['total_0_5'] = 3
+    assert float(compute_metric('avg_ro_cost', totals, '0-5Y')) == 500.0
+
+
+def test_add_metrics_skips_missing_sources_and_keeps_input():
+    frame = make_frame(rows=50)
+    before = frame.copy()
+
+    result = add_metrics(
+        frame, ['ro_ratio_of_avg_uio_5y', 'avg_ro_labor_cost'], '0-5Y'
+    )
+
+    pd.testing.assert_frame_equal(frame, before)
+    assert 'ro_ratio_of_avg_uio_5y' in result.columns
+    assert 'avg_ro_labor_cost' not in result.columns
+
+
+def test_recompute_derived_uses_age_group_totals():
+    frame = make_frame(rows=50).assign(avg_ro_cost=0.0, pct_age_0_3=0.0)
+
+    result = recompute_derived(frame, '0-5Y')
+
+    total = frame['total_0_5'].to_numpy(dtype='float64')
+    expected = np.divide(
+        frame['total_ro_cost'].to_numpy(), total,
+        out=np.zeros(len(frame)), where=total > 0
+    )
+    np.testing.assert_allclose(result['avg_ro_cost'].to_numpy(), expected)
+    assert (result['pct_age_0_3'].to_numpy()
+            == np.round(np.divide(
+                100 * frame['age_0_3'].to_numpy(dtype='float64'), total,
+                out=np.zeros(len(frame)), where=total > 0), 2)).all()
@@ -0,0 +1,109 @@
+"""
+Сверка векторной process_dataframe с прежней реализацией
+на большом синтетическом DataFrame
+"""
+import numpy as np
+import pandas as pd
+
+from app.functions import process_dataframe
+from database.schema import DNM_SCHEMA, apply_dnm_schema
+
+ROWS = 50000
+
+
+def legacy_process_dataframe(df):
+    """Прежняя реализация: to_numeric по колонкам и суммы по диапазонам"""
+    for col in df.columns[1:]:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    bands = {
+        'age_0_3': range(0, 4),
+        'age_4_5': range(4, 6),
+        'age_6_10': range(6, 11),
+    }
+    for band, years in bands.items():
+        if band not in df.columns:
+            cols = [f'age_{y}' for y in years if f'age_{y}' in df.columns]
+            if cols:
+                df[band] = df[cols].sum(axis=1)
+    return df
+
+
+def make_frame(rows=ROWS, seed=0):
+    """Синтетический результат DNM-запроса без возрастных диапазонов"""
+    rng = np.random.default_rng(seed)
+    data = {'model': rng.choice(['RIO', 'K5', 'SOUL', 'TOTAL'], rows)}
+    for year in range(0, 11):
+        data[f'age_{year}'] = rng.integers(0, 500, rows)
+    data['total_0_10'] = sum(data[f'age_{year}'] for year in range(0, 11))
+    data['uio_10y'] = rng.integers(100, 5000, rows)
+    data['total_ro_cost'] = rng.uniform(1e5, 1e8, rows)
+    data['avg_ro_cost'] = data['total_ro_cost'] / data['total_0_10']
+    return pd.DataFrame(data)
+
+
+def assert_same_values(result, expected):
+    assert list(result.columns) == list(expected.columns)
+    for col in expected.columns:
+        if col == 'model':
+            assert result[col].astype(str).tolist() == expected[col].tolist()
+            continue
+        np.testing.assert_allclose(
+            result[col].to_numpy(dtype='float64'),
+            expected[col].to_numpy(dtype='float64'),
+            rtol=1e-6, err_msg=col
+        )
+
+
+def test_matches_legacy_output():
+    frame = make_frame()
+    result = process_dataframe(frame.copy())
+    expected = legacy_process_dataframe(frame.copy())
+
+    assert_same_values(result, expected)
+    for col, dtype in result.dtypes.items():
+        assert dtype == DNM_SCHEMA[col], col
+
+
+def test_parses_text_values_and_fills_missing_counts():
+    frame = make_frame(rows=1000, seed=1)
+    frame['age_3'] = frame['age_3'].astype(str)
+    frame.loc[::7, 'age_3'] = 'n/a'
+    frame['total_ro_cost'] = frame['total_ro_cost'].astype(str)
+
+    result = process_dataframe(frame.copy())
+    expected = legacy_process_dataframe(frame.copy())
+    # Прежняя реализация оставляла NaN в счетчиках, схема — 0
+    expected['age_3'] = expected['age_3'].fillna(0)
+
+    assert result['age_3'].dtype == 'int32'
+    assert result['total_ro_cost'].dtype == 'float64'
+    np.testing.assert_array_equal(
+        result['age_3'].to_numpy(), expected['age_3'].to_numpy()
+    )
+    assert (
+        result['age_0_3'].to_numpy()
+        == result[[f'age_{y}' for y in range(4)]].sum(axis=1).to_numpy()
+    ).all()
+
+
+def test_keeps_existing_bands():
+    frame = make_frame(rows=100, seed=2)
+    frame['age_0_3'] = np.arange(100, dtype='int32')
+
+    result = process_dataframe(frame.copy())
+
+    np.testing.assert_array_equal(
+        result['age_0_3'].to_numpy(), np.arange(100)
+    )
+    assert {'age_4_5', 'age_6_10'} <= set(result.columns)
+
+
+def test_does_not_modify_input():
+    for frame in (make_frame(rows=100, seed=3),
+                  apply_dnm_schema(make_frame(rows=100, seed=3))):
+        before = frame.copy()
+
+        process_dataframe(frame)
+
+        pd.testing.assert_frame_equal(frame, before)
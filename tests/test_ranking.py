@@ -0,0 +1,39 @@
+"""
+Сверка частичного выбора топ-N моделей с полной сортировкой
+"""
+import numpy as np
+import pandas as pd
+
+from app.plotly_templates import rank_models, top_positions
+
+
+def test_top_positions_match_stable_sort():
+    rng = np.random.default_rng(0)
+    values = rng.integers(0, 50, 5000).astype('float64')
+    values[::7] = np.nan
+
+    for top in (1, 10, 300, 5000, 6000):
+        expected = (
+            pd.Series(values)
+            .sort_values(ascending=False, kind='stable')
+            .head(top).index.to_numpy()
+        )
+        np.testing.assert_array_equal(top_positions(values, top), expected)
+
+
+def test_rank_models_drops_total_and_ranks_every_chart_column():
+    rng = np.random.default_rng(1)
+    models = [f'M{i}' for i in range(400)] + ['TOTAL']
+    frame = pd.DataFrame({'model': models})
+    for col in ('total_ro_cost', 'labor_hours_0_10',
+                'aver_labor_hours_per_vhc', 'avg_ro_cost',
+                'ro_ratio_of_uio_10y', 'total_0_10'):
+        frame[col] = rng.uniform(0, 1e6, len(models))
+    frame.loc[400, 'total_ro_cost'] = 1e9
+
+    ranked = rank_models(frame, '0-10Y', top=250)
+
+    assert len(ranked) == 6
+    for col, data in ranked.items():
+        expected = frame[frame['model'] != 'TOTAL'].nlargest(250, col)
+        assert data['model'].tolist() == expected['model'].tolist(), col
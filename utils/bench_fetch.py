@@ -0,0 +1,60 @@
+"""
+Сравнение способов чтения результата DNM-запросов: DBAPI (rows)
+против COPY ... TO STDOUT (copy).
+
+Запуск из корня проекта:
+    python -m utils.bench_fetch --year 2024 --repeat 5
+"""
+import argparse
+import statistics
+import time
+
+from database.connection import FETCH_MODES, db_connection
+from database.queries import _build_dnm_query
+
+
+SCENARIOS = [
+    ('0-10Y', False),
+    ('0-5Y', False),
+    ('0-10Y', True),
+    ('0-5Y', True),
+]
+
+
+def bench_query(query, params, fetch_mode, repeat):
+    """Выполняет запрос repeat раз и возвращает (время, строки, память)"""
+    timings = []
+    df = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        df = db_connection.execute_query(query, params, fetch_mode)
+        timings.append(time.perf_counter() - start)
+    memory = df.memory_usage(deep=True).sum() if df is not None else 0
+    return timings, len(df), memory
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--year', type=int, default=None)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{"scenario":<18} {"mode":<5} {"median, s":>10} '
+          f'{"min, s":>8} {"rows":>7} {"MB":>7}')
+    for age_group, by_region in SCENARIOS:
+        statement, params = _build_dnm_query(
+            args.year, age_group, group_by_region=by_region
+        )
+        name = f'{age_group}{" by region" if by_region else ""}'
+        for fetch_mode in FETCH_MODES:
+            timings, rows, memory = bench_query(
+                statement.sql, params, fetch_mode, args.repeat
+            )
+            print(f'{name:<18} {fetch_mode:<5} '
+                  f'{statistics.median(timings):>10.3f} '
+                  f'{min(timings):>8.3f} {rows:>7} '
+                  f'{memory / 1e6:>7.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,6 +3,7 @@ import subprocess
 import time
 
 import matplotlib.pyplot as plt
+import plotly.io as pio
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.utils import ImageReader
@@ -41,7 +42,8 @@ def start_dashboard_server():
 
 
 def save_plotly_fig(fig, filename):
-    fig.write_image(filename, width=900, height=500, scale=2)
+    # Фигуры дашборда — словари, поэтому через plotly.io
+    pio.write_image(fig, filename, width=900, height=500, scale=2)
 
 
 def save_table_as_image(df, filename):